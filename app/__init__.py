@@ -29,6 +29,9 @@ def create_app(config_class=Config):
     # Initialize Plugins
     db.init_app(app)
     migrate.init_app(app, db)
+
+    from app.pathfinding import graph_cache
+    graph_cache.init_app(app)
     
     # Enable CORS (Allow React Admin & Unity App to talk to us)
     CORS(app, resources={r"/*": {"origins": "*"}}, allow_headers=["Content-Type", "Authorization"], methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"]) 
@@ -36,6 +39,17 @@ def create_app(config_class=Config):
     # Import models so Flask-Migrate can detect them
     from app import models
 
+    # Map the latest localization model artifact, shared by all workers
+    from app.ml import artifact_store, session_store, prediction_log
+    artifact_store.init_app(app)
+    session_store.init_app(app)
+    prediction_log.init_app(app)
+
+    # Fingerprint jobs left queued or running by a stopped worker go to this worker's pool
+    if app.config.get('FINGERPRINT_WORKERS', 2) > 0:
+        from app.ml.jobs import resume_jobs
+        app.before_request(resume_jobs)
+
     # Register Blueprints (Routes)
     from app.routes.auth import auth_bp
     from app.routes.main import main_bp
@@ -51,4 +65,8 @@ def create_app(config_class=Config):
     app.register_blueprint(node_bp, url_prefix='/api/nodes')
     app.register_blueprint(edge_bp, url_prefix='/api/edges')
 
+    # Register CLI commands
+    from app.cli import ml_cli
+    app.cli.add_command(ml_cli)
+
     return app
\ No newline at end of file
@@ -0,0 +1,392 @@
+import time
+import uuid
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import AppGroup
+
+# Maintenance and benchmark commands, run as `flask ml <command>`
+
+ml_cli = AppGroup('ml', help='Localization model commands.')
+
+
+@ml_cli.command('build')
+@click.option('--window-size', default=10, help='Samples per fingerprint window the model was trained on.')
+@click.option('--sample', default=2000, help='Fingerprints used for the leave-one-out accuracy estimate.')
+def build_model(window_size, sample):
+    """Write every fingerprint to a new memory-mappable model artifact.
+
+    The artifact is registered in ML_model and picked up by workers on
+    their next start.
+    """
+    from app.ml import build_artifact, model_options  # Import here to avoid circular imports
+
+    started = time.perf_counter()
+    model, path = build_artifact(
+        current_app.config['ML_ARTIFACT_DIR'],
+        window_size,
+        tree_min_rows=current_app.config.get('KNN_TREE_MIN_ROWS', 5000),
+        sample=sample,
+        options=model_options(),
+    )
+    click.echo(f"Model {model.model_id} written to {path} in {time.perf_counter() - started:.1f}s (accuracy {model.accuracy:.3f})")
+
+
+@ml_cli.command('benchmark-knn')
+@click.option('--sizes', default='1000,2000,5000,10000,20000,50000,100000', help='Comma-separated training set sizes.')
+@click.option('--queries', default=200, help='Query windows per size.')
+@click.option('--k', default=3, help='Neighbours per query.')
+@click.option('--leaf-size', default=32, help='k-d tree leaf size.')
+@click.option('--per-node', default=20, help='Fingerprints per surveyed node in the synthetic survey.')
+@click.option('--seed', default=0, help='Random seed.')
+def benchmark_knn(sizes, queries, k, leaf_size, per_node, seed):
+    """Compare brute-force and k-d tree fingerprint search.
+
+    Uses a synthetic survey shaped like the real one: 6-dimensional
+    mean/std windows clustered around one centre per node. Prints the
+    per-window query time of each mode and the smallest size where the
+    tree wins, a starting point for KNN_TREE_MIN_ROWS.
+    """
+    from app.ml import KNNModel  # Import here to avoid circular imports
+
+    rng = np.random.default_rng(seed)
+    click.echo(f"{'rows':>8} {'brute ms':>10} {'kdtree ms':>10} {'build ms':>10} {'agree':>6}")
+    crossover = None
+    for size in (int(s) for s in sizes.split(',') if s.strip()):
+        centres = rng.normal(0, 20, size=(max(size // per_node, 1), 6))
+        labels = rng.integers(0, len(centres), size)
+        X = centres[labels] + rng.normal(0, 1, size=(size, 6))
+        Q = centres[rng.integers(0, len(centres), queries)] + rng.normal(0, 1, size=(queries, 6))
+
+        brute = KNNModel(k=k, search='brute')
+        brute.fit(X, labels)
+        tree = KNNModel(k=k, search='kdtree', leaf_size=leaf_size)
+        started = time.perf_counter()
+        tree.fit(X, labels)
+        build = time.perf_counter() - started
+
+        started = time.perf_counter()
+        expected = brute.predict(Q)
+        brute_ms = (time.perf_counter() - started) * 1000 / queries
+        started = time.perf_counter()
+        predicted = tree.predict(Q)
+        tree_ms = (time.perf_counter() - started) * 1000 / queries
+
+        if crossover is None and tree_ms < brute_ms:
+            crossover = size
+        agree = float(np.mean(expected == predicted))
+        click.echo(f"{size:>8} {brute_ms:>10.3f} {tree_ms:>10.3f} {build * 1000:>10.1f} {agree:>6.3f}")
+
+    if crossover is None:
+        click.echo("Brute force was faster at every size")
+    else:
+        click.echo(f"k-d tree faster from {crossover} rows")
+
+
+@ml_cli.command('benchmark-options')
+@click.option('--source', type=click.Choice(['synthetic', 'db']), default='synthetic', help='Fingerprints to evaluate on.')
+@click.option('--size', default=20000, help='Synthetic survey size.')
+@click.option('--per-node', default=20, help='Fingerprints per node in the synthetic survey.')
+@click.option('--holdout', default=0.2, help='Share of fingerprints used as queries.')
+@click.option('--k', default=3, help='Neighbours per query.')
+@click.option('--seed', default=0, help='Random seed.')
+def benchmark_options(source, size, per_node, holdout, k, seed):
+    """Accuracy, latency and memory of the KNNModel options.
+
+    Compares the plain model with standardization, distance weighting and
+    float32 storage on a random holdout split. The synthetic survey has
+    mean features of tens of microtesla and std features below 3, like
+    real magnetometer windows.
+    """
+    from app.ml import KNNModel  # Import here to avoid circular imports
+    from app.ml.artifacts import FEATURES
+    from app.models import Mg_Fingerprint
+    from app import db
+
+    rng = np.random.default_rng(seed)
+    if source == 'db':
+        rows = db.session.query(*FEATURES, Mg_Fingerprint.node_id).all()
+        if len(rows) < 2:
+            raise click.ClickException("Not enough fingerprints in the database")
+        X = np.array([row[:6] for row in rows], dtype=np.float64)
+        y = np.array([row[6] for row in rows])
+    else:
+        nodes = max(size // per_node, 1)
+        means = rng.normal([20, -5, 40], 15, size=(nodes, 3))
+        stds = rng.uniform(0.2, 3.0, size=(nodes, 3))
+        y = rng.integers(0, nodes, size)
+        X = np.hstack([means[y] + rng.normal(0, 2, (size, 3)), stds[y] + rng.normal(0, 0.1, (size, 3))])
+
+    test = rng.random(len(X)) < holdout
+    configs = [
+        ('plain float64', {}),
+        ('standardize', {'standardize': True}),
+        ('standardize + distance', {'standardize': True, 'weights': 'distance'}),
+        ('standardize + distance + float32', {'standardize': True, 'weights': 'distance', 'dtype': 'float32'}),
+    ]
+    click.echo(f"{len(X)} fingerprints, {int(test.sum())} queries")
+    click.echo(f"{'options':<34} {'accuracy':>9} {'ms/window':>10} {'MB':>8}")
+    for name, options in configs:
+        model = KNNModel(k=k, **options)
+        model.fit(X[~test], y[~test])
+        started = time.perf_counter()
+        predicted = model.predict(X[test])
+        elapsed = (time.perf_counter() - started) * 1000 / max(int(test.sum()), 1)
+        accuracy = float(np.mean(predicted == y[test]))
+        click.echo(f"{name:<34} {accuracy:>9.3f} {elapsed:>10.3f} {model.nbytes / 1e6:>8.2f}")
+
+
+@ml_cli.command('evaluate')
+@click.option('--train-windows', default='5,10,20', help='Comma-separated fingerprint window sizes.')
+@click.option('--query-windows', default='3,5,10', help='Comma-separated localization window sizes.')
+@click.option('--ks', default='1,3,5,7', help='Comma-separated neighbour counts.')
+@click.option('--search', 'searches', default='brute,kdtree', help='Comma-separated search backends.')
+@click.option('--folds', default=5, help='Cross-validation folds over sessions.')
+@click.option('--request-samples', default=30, help='Readings per simulated /api/localize request.')
+@click.option('--seed', default=0, help='Random seed for the fold split.')
+@click.option('--save/--no-save', default=True, help='Record each setting in ML_model.')
+def evaluate(train_windows, query_windows, ks, searches, folds, request_samples, seed, save):
+    """Cross-validate window sizes, k and search backends on the raw survey.
+
+    Every stored survey session is assigned to one fold. Prints
+    request and window accuracy and predict latency per setting, best
+    first, and records them in ML_model as 'knn-eval' rows.
+    """
+    from app.ml import SEARCH_MODES, model_options  # Import here to avoid circular imports
+    from app.ml.evaluation import cross_validate, load_sessions, record_results
+
+    def integers(value):
+        return [int(v) for v in value.split(',') if v.strip()]
+
+    searches = [s.strip() for s in searches.split(',') if s.strip()]
+    unknown = [s for s in searches if s not in SEARCH_MODES]
+    if unknown:
+        raise click.BadParameter(f"unknown search backend {unknown[0]!r}", param_hint='--search')
+
+    sessions = load_sessions()
+    options = model_options()
+    click.echo(f"{len(sessions)} sessions, {sum(len(r) for _, _, r in sessions)} readings, {min(folds, len(sessions))} folds")
+    try:
+        results = cross_validate(
+            sessions, integers(train_windows), integers(query_windows), integers(ks), searches,
+            folds=folds, request_samples=request_samples, seed=seed, options=options,
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    results.sort(key=lambda r: (-r['request_accuracy'], r['ms_per_request']))
+    click.echo(f"{'train':>5} {'query':>5} {'k':>3} {'search':>7} {'req acc':>8} {'win acc':>8} {'ms/req':>8} {'ms/win':>8} {'fit ms':>8}")
+    for r in results:
+        click.echo(
+            f"{r['train_window']:>5} {r['query_window']:>5} {r['k']:>3} {r['search']:>7} "
+            f"{r['request_accuracy']:>8.3f} {r['window_accuracy']:>8.3f} {r['ms_per_request']:>8.3f} "
+            f"{r['ms_per_window']:>8.3f} {r['fit_ms']:>8.1f}"
+        )
+    if save and results:
+        models = record_results(results, options)
+        click.echo(f"Recorded as ML_model {models[0].model_id}-{models[-1].model_id}")
+
+
+@ml_cli.command('benchmark-ingest')
+@click.option('--samples', default=2000, help='Readings per simulated survey upload.')
+@click.option('--uploads', default=5, help='Uploads per ingestion path.')
+@click.option('--node-id', type=int, default=None, help='Node to attach the uploads to (default: the first node).')
+@click.option('--seed', default=0, help='Random seed.')
+def benchmark_ingest(samples, uploads, node_id, seed):
+    """Raw readings stored per second, per-row ORM inserts vs bulk ingestion.
+
+    The per-row path is the previous /api/fingerprint implementation: one
+    ORM object per reading and three commits. 'bulk rows' and 'packed' are
+    the two RAW_READINGS_STORAGE modes. Also times reading each session
+    back. Every row written by the benchmark is deleted afterwards.
+    """
+    from app import db  # Import here to avoid circular imports
+    from app.ml import windowed_statistics
+    from app.ml.ingest import FEATURE_COLUMNS, ingest_session, session_readings
+    from app.models import Mg_Fingerprint, Mg_Raw_Reading, Mg_session, Node
+
+    node = Node.query.get(node_id) if node_id is not None else Node.query.order_by(Node.node_id).first()
+    if node is None:
+        raise click.ClickException("No node to attach the uploads to")
+
+    def per_row(readings):
+        session = Mg_session(session_id=str(uuid.uuid4()), node_id=node.node_id)
+        db.session.add(session)
+        db.session.commit()
+        for x, y, z in readings.tolist():
+            db.session.add(Mg_Raw_Reading(session_id=session.session_id, mag_x=x, mag_y=y, mag_z=z))
+        db.session.commit()
+        fingerprints = []
+        for window in windowed_statistics(readings, 10).tolist():
+            fingerprints.append(Mg_Fingerprint(node_id=node.node_id, sample_count=10, **dict(zip(FEATURE_COLUMNS, window))))
+            db.session.add(fingerprints[-1])
+        db.session.commit()
+        return session.session_id, [f.fingerprint_id for f in fingerprints]
+
+    def bulk(storage):
+        def ingest(readings):
+            session_id, fingerprint_ids, _ = ingest_session(node.node_id, readings, window_size=10, storage=storage)
+            return session_id, fingerprint_ids
+        return ingest
+
+    rng = np.random.default_rng(seed)
+    click.echo(f"{db.engine.dialect.name}, {uploads} uploads of {samples} readings")
+    click.echo(f"{'path':<10} {'ms/upload':>10} {'rows/s':>10} {'read ms':>8}")
+    results = {}
+    for name, ingest in (('per-row', per_row), ('bulk rows', bulk('rows')), ('packed', bulk('blob'))):
+        session_ids, fingerprint_ids = [], []
+        elapsed = 0.0
+        for _ in range(uploads):
+            readings = rng.normal([20, -5, 40], 2, size=(samples, 3))
+            started = time.perf_counter()
+            session_id, ids = ingest(readings)
+            elapsed += time.perf_counter() - started
+            session_ids.append(session_id)
+            fingerprint_ids.extend(ids)
+        started = time.perf_counter()
+        for session_id in session_ids:
+            session_readings(session_id)
+        read = (time.perf_counter() - started) * 1000 / uploads
+        results[name] = samples * uploads / elapsed
+        click.echo(f"{name:<10} {elapsed * 1000 / uploads:>10.1f} {results[name]:>10.0f} {read:>8.2f}")
+
+        Mg_Raw_Reading.query.filter(Mg_Raw_Reading.session_id.in_(session_ids)).delete(synchronize_session=False)
+        Mg_Fingerprint.query.filter(Mg_Fingerprint.fingerprint_id.in_(fingerprint_ids)).delete(synchronize_session=False)
+        Mg_session.query.filter(Mg_session.session_id.in_(session_ids)).delete(synchronize_session=False)
+        db.session.commit()
+    for name in ('bulk rows', 'packed'):
+        click.echo(f"{name} ingestion is {results[name] / results['per-row']:.1f}x faster than per-row")
+
+
+@ml_cli.command('work')
+@click.option('--poll', default=2.0, help='Seconds between checks for queued fingerprint jobs.')
+@click.option('--once', is_flag=True, help='Run the jobs queued now and exit.')
+@click.option('--requeue-after', default=600, help='Seconds after which a running job is treated as abandoned and queued again.')
+def work(poll, once, requeue_after):
+    """Compute queued fingerprint jobs in this process.
+
+    Use with FINGERPRINT_WORKERS=0 to keep fingerprint computation out of
+    the web workers. Jobs are claimed atomically, so several workers can
+    share the queue.
+    """
+    from app.ml.jobs import requeue_stale, run_pending  # Import here to avoid circular imports
+
+    while True:
+        requeued = requeue_stale(requeue_after)
+        if requeued:
+            click.echo(f"Requeued {requeued} abandoned jobs")
+        ran = run_pending()
+        if ran:
+            click.echo(f"Ran {ran} fingerprint jobs")
+        if once:
+            return
+        if not ran:
+            time.sleep(poll)
+
+
+@ml_cli.command('benchmark-indexes')
+@click.option('--buildings', default=10, help='Buildings in the synthetic venue.')
+@click.option('--floors', default=5, help='Floors per building.')
+@click.option('--nodes', default=400, help='Nodes per floor.')
+@click.option('--fingerprints', default=10, help='Fingerprints per node.')
+@click.option('--sessions', default=2000, help='Survey sessions stored as Mg_Raw_Reading rows.')
+@click.option('--readings', default=100, help='Readings per session.')
+@click.option('--repeat', default=50, help='Runs of each query.')
+@click.option('--seed', default=0, help='Random seed.')
+def benchmark_indexes(buildings, floors, nodes, fingerprints, sessions, readings, repeat, seed):
+    """Query plans and latencies of the hot filters, without and with indexes.
+
+    Seeds a synthetic venue into an in-memory SQLite database (the app
+    database is not touched), runs the queries behind graph building,
+    model loading and session reads, then creates the model indexes and
+    runs them again.
+    """
+    import sqlalchemy as sa  # Import here to avoid circular imports
+    from app import db
+    from app.models import Building, Edge, Floor, Mg_Fingerprint, Mg_Raw_Reading, Mg_session, Node
+
+    rng = np.random.default_rng(seed)
+    engine = sa.create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    indexes = [index for table in db.metadata.sorted_tables for index in table.indexes]
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for index in indexes:
+            index.drop(conn)
+        floor_count = buildings * floors
+        node_count = floor_count * nodes
+        conn.execute(sa.insert(Building), [{'building_id': b + 1, 'name': f'B{b}'} for b in range(buildings)])
+        conn.execute(sa.insert(Floor), [
+            {'floor_id': f + 1, 'building_id': f // floors + 1, 'floor_number': f % floors, 'scale': 1.0, 'origin_x': 0.0, 'origin_y': 0.0}
+            for f in range(floor_count)
+        ])
+        conn.execute(sa.insert(Node), [
+            {'node_id': n + 1, 'name': f'N{n}', 'x_coordinate': float(n % 20), 'y_coordinate': float(n // 20 % 20), 'node_type': 'corridor', 'floor_id': n // nodes + 1}
+            for n in range(node_count)
+        ])
+        # Two edges per node to a random node on the same floor, inserted floor-interleaved like a venue edited over time
+        starts = rng.permutation(np.repeat(np.arange(node_count), 2))
+        ends = starts // nodes * nodes + rng.integers(0, nodes, len(starts))
+        conn.execute(sa.insert(Edge), [
+            {'start_node_id': a + 1, 'end_node_id': b + 1, 'distance': 1.0, 'floor_id': a // nodes + 1, 'is_walkable': True}
+            for a, b in zip(starts.tolist(), ends.tolist())
+        ])
+        owners = rng.integers(0, node_count, node_count * fingerprints)
+        conn.execute(sa.insert(Mg_Fingerprint), [
+            {'node_id': n + 1, 'mean_x': 1.0, 'mean_y': 1.0, 'mean_z': 1.0, 'std_x': 1.0, 'std_y': 1.0, 'std_z': 1.0, 'sample_count': 10}
+            for n in owners.tolist()
+        ])
+        session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+        conn.execute(sa.insert(Mg_session), [{'session_id': s, 'node_id': int(rng.integers(node_count)) + 1} for s in session_ids])
+        # Uploads from several surveyors arrive interleaved
+        conn.execute(sa.insert(Mg_Raw_Reading), [
+            {'session_id': session_ids[s], 'mag_x': 1.0, 'mag_y': 1.0, 'mag_z': 1.0}
+            for s in rng.permutation(np.repeat(np.arange(sessions), readings)).tolist()
+        ])
+    click.echo(f"Seeded {node_count} nodes, {len(starts)} edges, {len(owners)} fingerprints, {sessions * readings} readings in {time.perf_counter() - started:.1f}s")
+
+    queries = [
+        ('edges of a floor', lambda: sa.select(Edge).where(Edge.floor_id == int(rng.integers(floor_count)) + 1)),
+        ('nodes of a floor', lambda: sa.select(Node).where(Node.floor_id == int(rng.integers(floor_count)) + 1)),
+        ('floors of a building', lambda: sa.select(Floor).where(Floor.building_id == int(rng.integers(buildings)) + 1).order_by(Floor.floor_number)),
+        ('fingerprints of a node', lambda: sa.select(Mg_Fingerprint).where(Mg_Fingerprint.node_id == int(rng.integers(node_count)) + 1)),
+        ('fingerprints of a floor', lambda: (
+            sa.select(Mg_Fingerprint.mean_x, Mg_Fingerprint.node_id, Mg_Fingerprint.fingerprint_id)
+            .join(Node, Node.node_id == Mg_Fingerprint.node_id)
+            .where(Node.floor_id == int(rng.integers(floor_count)) + 1)
+            .order_by(Mg_Fingerprint.fingerprint_id)
+        )),
+        ('readings of a session', lambda: (
+            sa.select(Mg_Raw_Reading.mag_x, Mg_Raw_Reading.mag_y, Mg_Raw_Reading.mag_z)
+            .where(Mg_Raw_Reading.session_id == session_ids[int(rng.integers(sessions))])
+            .order_by(Mg_Raw_Reading.reading_id)
+        )),
+    ]
+
+    def run():
+        timings = {}
+        with engine.connect() as conn:
+            for name, build in queries:
+                statement = build()
+                compiled = statement.compile(engine, compile_kwargs={'literal_binds': True})
+                plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}")]
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    conn.execute(build()).fetchall()
+                timings[name] = (time.perf_counter() - started) * 1000 / repeat
+                click.echo(f"  {name}: {timings[name]:.2f} ms | {'; '.join(plan)}")
+        return timings
+
+    click.echo("Without indexes:")
+    before = run()
+    with engine.begin() as conn:
+        for index in indexes:
+            index.create(conn)
+        conn.exec_driver_sql("ANALYZE")
+    click.echo(f"With {len(indexes)} indexes:")
+    after = run()
+
+    click.echo(f"{'query':<26} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name, _ in queries:
+        click.echo(f"{name:<26} {before[name]:>10.2f} {after[name]:>10.2f} {before[name] / max(after[name], 1e-9):>7.1f}x")
@@ -1,3 +1,7 @@
-from .knn_model import KNNModel, windowed_statistics
+from .knn_model import KNNModel, SEARCH_MODES, WEIGHT_MODES, BINARY_FORMATS, readings_to_array, decode_readings, windowed_statistics
+from .artifacts import ModelArtifact, artifact_store, build_artifact
+from .tracking import TrackingSession, session_store
+from .prediction_log import prediction_log, accuracy_rollup
+from .registry import get_model, model_options, append_fingerprints, invalidate_fingerprints
 
-__all__ = ['KNNModel', 'windowed_statistics']
+__all__ = ['KNNModel', 'SEARCH_MODES', 'WEIGHT_MODES', 'BINARY_FORMATS', 'readings_to_array', 'decode_readings', 'windowed_statistics', 'ModelArtifact', 'artifact_store', 'build_artifact', 'TrackingSession', 'session_store', 'prediction_log', 'accuracy_rollup', 'get_model', 'model_options', 'append_fingerprints', 'invalidate_fingerprints']
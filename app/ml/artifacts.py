@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import shutil
+import numpy as np
+from app import db
+from app.models import Floor, ML_model, Mg_Fingerprint, Node
+from app.ml.knn_model import KNNModel
+from app.spatial import KDTree
+
+# Versioned on-disk KNN artifacts, memory-mapped by every worker
+
+logger = logging.getLogger(__name__)
+
+MODEL_TYPE = 'knn'
+FEATURES = (
+    Mg_Fingerprint.mean_x, Mg_Fingerprint.mean_y, Mg_Fingerprint.mean_z,
+    Mg_Fingerprint.std_x, Mg_Fingerprint.std_y, Mg_Fingerprint.std_z,
+)
+
+
+def artifact_path(directory, model_id):
+    return os.path.join(directory, f'{MODEL_TYPE}-{model_id}')
+
+
+def scope_name(scope):
+    return ':'.join(str(part) for part in scope)
+
+
+class ModelArtifact:
+    """Training rows and k-d trees of one ML_model row, opened with mmap.
+
+    Rows are sorted by building, floor and fingerprint_id, so every floor
+    and building partition is a contiguous slice of the same arrays and
+    building a partition model copies nothing. Pages are shared between
+    all processes that map the artifact.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.model_id = self.manifest['model_id']
+        self.max_fingerprint_id = self.manifest['max_fingerprint_id']
+        self.options = self.manifest.get('options', {})
+        self.X = self._load('X')
+        self.y = self._load('y')
+        self.mean = self._load('mean') if self.options.get('standardize') else None
+        self.scale = self._load('scale') if self.options.get('standardize') else None
+
+    def _load(self, name):
+        return np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r')
+
+    @property
+    def nbytes(self):
+        return self.X.nbytes + self.y.nbytes
+
+    def rows(self, scope):
+        start, end = self.manifest['partitions'].get(scope_name(scope), (0, 0))
+        return end - start
+
+    def fingerprint_ids(self, scope):
+        """Sorted fingerprint ids of the rows of ``scope``."""
+        start, end = self.manifest['partitions'].get(scope_name(scope), (0, 0))
+        return np.sort(self._load('fingerprint_ids')[start:end])
+
+    def model(self, scope, search, k=3):
+        """KNNModel over the rows of ``scope``; unknown scopes are empty.
+
+        The model uses the options the artifact was built with. Rows are
+        stored already transformed, with scaling fitted on all fingerprints.
+        """
+        start, end = self.manifest['partitions'].get(scope_name(scope), (0, 0))
+        model = KNNModel(k=k, search=search, **self.options)
+        tree = None
+        if search == 'kdtree' and scope_name(scope) in self.manifest['trees']:
+            directory = os.path.join(self.path, 'trees', scope_name(scope))
+            arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in KDTree.ARRAYS}
+            tree = KDTree(self.X[start:end], model.leaf_size, arrays)
+        model.restore(self.X[start:end], self.y[start:end], tree, self.mean, self.scale)
+        return model
+
+
+class ArtifactStore:
+    """Process-wide handle on the latest artifact, loaded at startup."""
+
+    def __init__(self):
+        self.directory = None
+        self.current = None
+
+    def init_app(self, app):
+        self.directory = app.config.get('ML_ARTIFACT_DIR')
+        if not self.directory or not os.path.isdir(self.directory) or not app.config.get('ML_LOAD_ARTIFACT', True):
+            return
+        with app.app_context():
+            try:
+                self.load_latest()
+            except Exception as e:
+                # A missing table or unreadable file must not stop the app from booting
+                logger.warning("Could not load the latest model artifact: %s", e)
+
+    def load_latest(self):
+        """Map the newest ML_model artifact found on disk; returns it or None."""
+        models = ML_model.query.filter_by(model_type=MODEL_TYPE).order_by(ML_model.model_id.desc()).all()
+        for row in models:
+            path = artifact_path(self.directory, row.model_id)
+            if os.path.exists(os.path.join(path, 'manifest.json')):
+                self.current = ModelArtifact(path)
+                return self.current
+        return None
+
+
+artifact_store = ArtifactStore()
+
+
+def build_artifact(directory, window_size, k=3, tree_min_rows=5000, sample=2000, seed=0, options=None):
+    """Write the current fingerprints as a new artifact and register it in ML_model.
+
+    The accuracy stored with the model is a leave-one-out estimate over
+    ``sample`` random fingerprints. Trees are saved for every partition of
+    at least ``tree_min_rows`` rows. ``options`` are KNNModel keyword
+    arguments (standardize, weights, dtype) baked into the artifact.
+    """
+    options = dict(options or {})
+    rows = (
+        db.session.query(*FEATURES, Mg_Fingerprint.node_id, Mg_Fingerprint.fingerprint_id, Node.floor_id, Floor.building_id)
+        .join(Node, Node.node_id == Mg_Fingerprint.node_id)
+        .join(Floor, Floor.floor_id == Node.floor_id)
+        .order_by(Floor.building_id, Node.floor_id, Mg_Fingerprint.fingerprint_id)
+        .all()
+    )
+    if not rows:
+        raise ValueError("No fingerprints to build a model from")
+    X = np.array([row[:6] for row in rows], dtype=np.float64)
+    y = np.array([row[6] for row in rows], dtype=np.int64)
+    fingerprint_ids = np.array([row[7] for row in rows], dtype=np.int64)
+    floor_ids = np.array([row[8] for row in rows], dtype=np.int64)
+    building_ids = np.array([row[9] for row in rows], dtype=np.int64)
+
+    partitions = {'all': (0, len(rows))}
+    for name, ids in (('building', building_ids), ('floor', floor_ids)):
+        values, starts, counts = np.unique(ids, return_index=True, return_counts=True)
+        for value, start, count in zip(values.tolist(), starts.tolist(), counts.tolist()):
+            partitions[f'{name}:{value}'] = (start, start + count)
+
+    accuracy = leave_one_out_accuracy(X, y, k, sample, seed, options)
+    knn = KNNModel(k=k, **options)
+    knn.fit(X, y)
+    X = knn.X_train
+
+    model = ML_model(model_type=MODEL_TYPE, window_size=window_size, accuracy=accuracy)
+    db.session.add(model)
+    db.session.flush()
+
+    path = artifact_path(directory, model.model_id)
+    staging = path + '.tmp'
+    try:
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(os.path.join(staging, 'trees'))
+        for name, array in (('X', X), ('y', y), ('fingerprint_ids', fingerprint_ids), ('floor_ids', floor_ids), ('building_ids', building_ids)):
+            np.save(os.path.join(staging, f'{name}.npy'), array)
+        if knn.mean_ is not None:
+            np.save(os.path.join(staging, 'mean.npy'), knn.mean_)
+            np.save(os.path.join(staging, 'scale.npy'), knn.scale_)
+
+        trees = []
+        for name, (start, end) in partitions.items():
+            if end - start < tree_min_rows:
+                continue
+            tree_dir = os.path.join(staging, 'trees', name)
+            os.makedirs(tree_dir)
+            for array_name, array in KDTree(X[start:end], KNNModel().leaf_size).arrays().items():
+                np.save(os.path.join(tree_dir, f'{array_name}.npy'), array)
+            trees.append(name)
+
+        with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+            json.dump({
+                'model_id': model.model_id,
+                'window_size': window_size,
+                'k': k,
+                'rows': len(rows),
+                'max_fingerprint_id': int(fingerprint_ids.max()),
+                'partitions': partitions,
+                'trees': trees,
+                'options': options,
+            }, f)
+        os.replace(staging, path)
+    except Exception:
+        db.session.rollback()
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    db.session.commit()
+    return model, path
+
+
+def leave_one_out_accuracy(X, y, k=3, sample=2000, seed=0, options=None):
+    """Share of sampled rows whose label the other rows predict correctly."""
+    if len(X) < 2:
+        return 0.0
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(X), size=min(sample, len(X)), replace=False))
+    model = KNNModel(k=k, **(options or {}))
+    model.fit(X, y)
+    X_train = model.X_train
+    correct = 0
+    for start in range(0, len(rows), 256):
+        block = rows[start:start + 256]
+        distances = np.vstack(list(model._distance_chunks(X_train[block], X_train)))
+        distances[np.arange(len(block)), block] = np.inf  # Leave the row itself out
+        for row, neighbors, row_distances in zip(block, model._nearest(distances), distances):
+            labels = [y[i] for i in neighbors]
+            correct += model.vote(labels, row_distances[neighbors]) == y[row]
+    return correct / len(rows)
@@ -0,0 +1,164 @@
+import time
+from collections import Counter
+import numpy as np
+from app import db
+from app.models import ML_model, Mg_Raw_Reading, Mg_session
+from app.ml.ingest import unpack_readings
+from app.ml.knn_model import KNNModel, windowed_statistics
+
+# Offline cross-validation of localization settings over stored raw sessions
+
+MODEL_TYPE = 'knn-eval'
+
+
+def load_sessions():
+    """``(session_id, node_id, readings)`` for every surveyed session with readings.
+
+    Packed sessions are decoded from Mg_session; older sessions are
+    rebuilt from their Mg_Raw_Reading rows.
+    """
+    sessions = [
+        (session_id, node_id, unpack_readings(blob))
+        for session_id, node_id, blob in (
+            db.session.query(Mg_session.session_id, Mg_session.node_id, Mg_session.readings)
+            .filter(Mg_session.readings.isnot(None))
+            .order_by(Mg_session.session_id)
+        )
+    ]
+    rows = (
+        db.session.query(Mg_Raw_Reading.session_id, Mg_session.node_id, Mg_Raw_Reading.mag_x, Mg_Raw_Reading.mag_y, Mg_Raw_Reading.mag_z)
+        .join(Mg_session, Mg_session.session_id == Mg_Raw_Reading.session_id)
+        .filter(Mg_session.readings.is_(None))
+        .order_by(Mg_Raw_Reading.session_id, Mg_Raw_Reading.reading_id)
+        .all()
+    )
+    if rows:
+        session_ids = [row[0] for row in rows]
+        readings = np.array([row[2:] for row in rows], dtype=np.float64)
+        starts = [0] + [i for i in range(1, len(rows)) if session_ids[i] != session_ids[i - 1]] + [len(rows)]
+        sessions.extend((session_ids[lo], rows[lo][1], readings[lo:hi]) for lo, hi in zip(starts, starts[1:]))
+    return [session for session in sessions if len(session[2])]
+
+
+def cross_validate(sessions, train_windows=(10,), query_windows=(3,), ks=(3,), searches=('brute',),
+                   folds=5, request_samples=30, seed=0, options=None):
+    """Grouped k-fold evaluation of every combination of the given settings.
+
+    Sessions, not windows, are split into folds, so no query shares a
+    survey walk with the fingerprints it is matched against. Each node's
+    sessions are spread over the folds, so a node is only missing from
+    training when it has a single session. Training sessions are cut into
+    non-overlapping windows of each training size.
+    Test sessions are cut into requests of ``request_samples`` readings,
+    each localized like one /api/localize call: its windows are predicted
+    in one batch and the majority label wins.
+
+    Returns one dict per setting with request and window accuracy, the
+    mean predict latency per request and per window, and the fit time.
+    """
+    if len(sessions) < 2:
+        raise ValueError("At least two sessions are needed for cross-validation")
+    folds = min(folds, len(sessions))
+    assignment = assign_folds([node_id for _, node_id, _ in sessions], folds, seed)
+    totals = {}
+
+    for fold in range(folds):
+        test = np.flatnonzero(assignment == fold)
+        held_out = set(test.tolist())
+        train = [sessions[i] for i in range(len(sessions)) if i not in held_out]
+        for train_window in train_windows:
+            X_train, y_train = session_windows(train, train_window)
+            if not len(X_train):
+                continue
+            for query_window in query_windows:
+                requests = [
+                    (windowed_statistics(chunk, query_window), sessions[i][1])
+                    for i in test.tolist()
+                    for chunk in request_chunks(sessions[i][2], request_samples)
+                ]
+                requests = [(windows, label) for windows, label in requests if len(windows)]
+                for k in ks:
+                    for search in searches:
+                        key = (train_window, query_window, k, search)
+                        total = totals.setdefault(key, Counter())
+                        evaluate_fold(total, X_train, y_train, requests, k, search, options)
+
+    results = []
+    for (train_window, query_window, k, search), total in totals.items():
+        if not total['requests']:
+            continue
+        results.append({
+            'train_window': train_window,
+            'query_window': query_window,
+            'k': k,
+            'search': search,
+            'request_accuracy': total['correct_requests'] / total['requests'],
+            'window_accuracy': total['correct_windows'] / total['windows'],
+            'ms_per_request': total['predict_seconds'] * 1000 / total['requests'],
+            'ms_per_window': total['predict_seconds'] * 1000 / total['windows'],
+            'fit_ms': total['fit_seconds'] * 1000 / total['folds'],
+            'train_rows': total['train_rows'] // total['folds'],
+            'requests': total['requests'],
+            'folds': total['folds'],
+        })
+    return results
+
+
+def assign_folds(labels, folds, seed=0):
+    """Fold number per session, dealing each node's sessions round-robin from a random fold."""
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels)
+    assignment = np.empty(len(labels), dtype=np.int64)
+    for label in np.unique(labels):
+        members = rng.permutation(np.flatnonzero(labels == label))
+        assignment[members] = (rng.integers(folds) + np.arange(len(members))) % folds
+    return assignment
+
+
+def evaluate_fold(total, X_train, y_train, requests, k, search, options=None):
+    model = KNNModel(k=k, search=search, **(options or {}))
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    total['fit_seconds'] += time.perf_counter() - started
+    total['train_rows'] += len(X_train)
+    total['folds'] += 1
+
+    for windows, label in requests:
+        started = time.perf_counter()
+        predictions = model.predict(windows)
+        total['predict_seconds'] += time.perf_counter() - started
+        total['requests'] += 1
+        total['windows'] += len(windows)
+        total['correct_windows'] += int(np.sum(np.asarray(predictions) == label))
+        total['correct_requests'] += int(Counter(predictions).most_common(1)[0][0] == label)
+
+
+def session_windows(sessions, window_size):
+    """Non-overlapping training windows and their node labels."""
+    blocks = [(windowed_statistics(readings, window_size), node_id) for _, node_id, readings in sessions]
+    X = np.vstack([windows for windows, _ in blocks]) if blocks else np.empty((0, 6))
+    y = np.concatenate([np.full(len(windows), node_id) for windows, node_id in blocks]) if blocks else np.empty(0)
+    return X, y
+
+
+def request_chunks(readings, samples):
+    """Consecutive slices of ``samples`` readings; a shorter tail is dropped."""
+    return [readings[start:start + samples] for start in range(0, len(readings) - samples + 1, samples)]
+
+
+def record_results(results, options=None):
+    """Store each result as an ML_model row of type 'knn-eval'."""
+    models = []
+    for result in results:
+        parameters = {name: value for name, value in result.items() if name not in ('train_window', 'request_accuracy', 'ms_per_request')}
+        parameters['options'] = dict(options or {})
+        models.append(ML_model(
+            model_type=MODEL_TYPE,
+            window_size=result['train_window'],
+            accuracy=result['request_accuracy'],
+            latency_ms=result['ms_per_request'],
+            parameters=parameters,
+        ))
+    db.session.add_all(models)
+    db.session.commit()
+    return models
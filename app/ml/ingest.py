@@ -0,0 +1,136 @@
+import io
+import uuid
+import zlib
+from datetime import datetime
+import numpy as np
+from app import db
+from app.models import Mg_Fingerprint, Mg_Raw_Reading, Mg_session
+from app.ml.knn_model import windowed_statistics
+
+# Survey uploads stored in one transaction, with readings packed per session or bulk inserted as rows
+
+FEATURE_COLUMNS = ('mean_x', 'mean_y', 'mean_z', 'std_x', 'std_y', 'std_z')
+
+# Raw readings storage: 'blob' packs a session into Mg_session.readings, 'rows' writes Mg_Raw_Reading rows
+STORAGE_MODES = ('blob', 'rows')
+
+# zlib level for packed sessions
+COMPRESSION_LEVEL = 6
+
+
+def ingest_session(node_id, readings, window_size=10, stride=None, storage='blob'):
+    """Store one survey upload; returns ``(session_id, fingerprint_ids, windows)``.
+
+    ``readings`` is an ``(n, 3)`` array. The session, its raw readings and
+    its fingerprints are written in a single transaction, so a failure
+    leaves nothing behind. With ``storage='blob'`` the readings are packed
+    into the session row itself. Raises ValueError, before touching the
+    database, when the readings do not fill one window.
+    """
+    readings = np.asarray(readings, dtype=np.float64).reshape(-1, 3)
+    windows = windowed_statistics(readings, window_size, stride)
+    if not len(windows):
+        raise ValueError("Not enough data to form a complete window")
+
+    try:
+        session_id = add_session(node_id, readings, storage)
+        fingerprint_ids = insert_fingerprints(node_id, windows, window_size)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return session_id, fingerprint_ids, windows
+
+
+def add_session(node_id, readings, storage='blob'):
+    """Add a session and its readings to the current transaction; returns its id."""
+    session_id = str(uuid.uuid4())
+    if storage == 'blob':
+        db.session.add(Mg_session(session_id=session_id, node_id=node_id, readings=pack_readings(readings), reading_count=len(readings)))
+    else:
+        db.session.add(Mg_session(session_id=session_id, node_id=node_id))
+        db.session.flush()
+        insert_readings(session_id, readings)
+    return session_id
+
+
+def pack_readings(readings):
+    """Compressed bytes of an ``(n, 3)`` readings array, lossless.
+
+    The little-endian float64 values are byte-shuffled (all first bytes,
+    then all second bytes, ...) before zlib, which groups the slowly
+    changing sign and exponent bytes together.
+    """
+    values = np.ascontiguousarray(readings, dtype='<f8').reshape(-1)
+    return zlib.compress(values.view(np.uint8).reshape(-1, 8).T.tobytes(), COMPRESSION_LEVEL)
+
+
+def unpack_readings(blob):
+    """Inverse of ``pack_readings``."""
+    shuffled = np.frombuffer(zlib.decompress(blob), dtype=np.uint8).reshape(8, -1)
+    return shuffled.T.copy().view('<f8').reshape(-1, 3)
+
+
+def session_readings(session_id):
+    """``(n, 3)`` readings of one session; None when it does not exist.
+
+    A packed session costs one fetch and one decode; sessions stored as
+    Mg_Raw_Reading rows are read row by row.
+    """
+    row = db.session.query(Mg_session.readings).filter_by(session_id=session_id).first()
+    if row is None:
+        return None
+    if row.readings is not None:
+        return unpack_readings(row.readings)
+    values = (
+        db.session.query(Mg_Raw_Reading.mag_x, Mg_Raw_Reading.mag_y, Mg_Raw_Reading.mag_z)
+        .filter_by(session_id=session_id)
+        .order_by(Mg_Raw_Reading.reading_id)
+        .all()
+    )
+    return np.array(values, dtype=np.float64).reshape(-1, 3)
+
+
+def insert_readings(session_id, readings, timestamp=None):
+    """Bulk insert raw readings in the current transaction.
+
+    PostgreSQL (psycopg2) gets a single COPY; other databases an
+    executemany INSERT. All rows share one timestamp.
+    """
+    timestamp = timestamp or datetime.utcnow()
+    bind = db.session.get_bind()
+    if bind.dialect.name == 'postgresql' and bind.dialect.driver == 'psycopg2':
+        copy_readings(session_id, readings, timestamp)
+        return
+    db.session.execute(db.insert(Mg_Raw_Reading), [
+        {'session_id': session_id, 'mag_x': x, 'mag_y': y, 'mag_z': z, 'timestamp': timestamp}
+        for x, y, z in readings.tolist()
+    ])
+
+
+def copy_readings(session_id, readings, timestamp):
+    preparer = db.session.get_bind().dialect.identifier_preparer
+    columns = ', '.join(preparer.quote(c) for c in ('session_id', 'mag_x', 'mag_y', 'mag_z', 'timestamp'))
+    buffer = io.StringIO()
+    prefix = session_id.replace('%', '%%')
+    np.savetxt(buffer, readings, fmt=f'{prefix}\t%.17g\t%.17g\t%.17g\t{timestamp.isoformat()}')
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {preparer.quote(Mg_Raw_Reading.__tablename__)} ({columns}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+
+def insert_fingerprints(node_id, windows, sample_count):
+    """Bulk insert fingerprint rows; returns their ids in window order."""
+    timestamp = datetime.utcnow()
+    rows = [
+        dict(zip(FEATURE_COLUMNS, window), node_id=node_id, sample_count=sample_count, created_at=timestamp)
+        for window in windows.tolist()
+    ]
+    result = db.session.execute(
+        db.insert(Mg_Fingerprint).returning(Mg_Fingerprint.fingerprint_id, sort_by_parameter_order=True),
+        rows,
+    )
+    return [fingerprint_id for (fingerprint_id,) in result]
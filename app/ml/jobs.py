@@ -0,0 +1,194 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import numpy as np
+from flask import current_app
+from app import db
+from app.models import Fingerprint_job, Mg_session, Node
+from app.ml.ingest import add_session, insert_fingerprints, session_readings
+from app.ml.knn_model import windowed_statistics
+from app.ml.registry import append_fingerprints, invalidate_fingerprints
+
+# Fingerprint computation queued in the database and run off the request thread
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+_pools = {}
+_resumed_at = None
+_resume_lock = threading.Lock()
+
+
+def _pool(workers):
+    if workers not in _pools:
+        _pools[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fingerprint-jobs')
+    return _pools[workers]
+
+
+def queue_fingerprints(node_id, readings, window_size=10, stride=None, storage='blob'):
+    """Store a survey upload with a queued job in one transaction; returns the job.
+
+    Only the session and its readings are written here. Raises ValueError,
+    before touching the database, when the readings do not fill one window.
+    """
+    readings = np.asarray(readings, dtype=np.float64).reshape(-1, 3)
+    if len(readings) < window_size:
+        raise ValueError("Not enough data to form a complete window")
+
+    try:
+        session_id = add_session(node_id, readings, storage)
+        job = Fingerprint_job(job_id=str(uuid.uuid4()), session_id=session_id, status='queued', window_size=window_size, stride=stride)
+        db.session.add(job)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    schedule_job(job.job_id)
+    return job
+
+
+def schedule_job(job_id):
+    """Run a job on this process's worker pool.
+
+    Does nothing with FINGERPRINT_WORKERS=0, which leaves queued jobs to a
+    separate `flask ml work` process.
+    """
+    workers = current_app.config.get('FINGERPRINT_WORKERS', 2)
+    if workers <= 0:
+        return
+    _pool(workers).submit(_run, current_app._get_current_object(), job_id)
+
+
+def resume_jobs():
+    """Hand jobs left behind by stopped workers to this process's pool.
+
+    Runs before requests when FINGERPRINT_WORKERS is above 0, at most once
+    every FINGERPRINT_JOB_TIMEOUT seconds. Jobs 'running' for longer than
+    that are queued again, then every queued job is scheduled; claiming
+    is atomic, so a job picked up by several workers still runs once.
+    """
+    global _resumed_at
+    timeout = current_app.config.get('FINGERPRINT_JOB_TIMEOUT', 600)
+    with _resume_lock:
+        now = time.monotonic()
+        if _resumed_at is not None and now - _resumed_at < timeout:
+            return
+        _resumed_at = now
+    requeued = requeue_stale(timeout)
+    if requeued:
+        logger.warning("Requeued %d abandoned fingerprint jobs", requeued)
+    query = db.session.query(Fingerprint_job.job_id).filter_by(status='queued').order_by(Fingerprint_job.created_at)
+    for (job_id,) in query.all():
+        schedule_job(job_id)
+
+
+def _run(app, job_id):
+    with app.app_context():
+        try:
+            run_job(job_id)
+        except Exception:
+            logger.exception("Fingerprint job %s failed", job_id)
+
+
+def claim_job(job_id):
+    """Move a queued job to 'running' and return its started_at; None when another worker got it first."""
+    started_at = datetime.utcnow()
+    result = db.session.execute(
+        db.update(Fingerprint_job)
+        .where(Fingerprint_job.job_id == job_id, Fingerprint_job.status == 'queued')
+        .values(status='running', started_at=started_at)
+    )
+    db.session.commit()
+    return started_at if result.rowcount == 1 else None
+
+
+def finish_job(job_id, started_at, **values):
+    """Set the outcome of a job this runner still owns; False if it was requeued meanwhile.
+
+    The job is only updated while it is 'running' with the ``started_at``
+    set by ``claim_job``, so a runner whose job was requeued and claimed
+    again by another worker cannot overwrite that worker's result.
+    """
+    result = db.session.execute(
+        db.update(Fingerprint_job)
+        .where(Fingerprint_job.job_id == job_id, Fingerprint_job.status == 'running', Fingerprint_job.started_at == started_at)
+        .values(finished_at=datetime.utcnow(), **values)
+    )
+    return result.rowcount == 1
+
+
+def run_job(job_id):
+    """Compute and store the fingerprints of a queued job.
+
+    The fingerprints and the 'done' status are committed together, then the
+    cached models of this process are updated as after a synchronous
+    upload. Other processes append the rows on their next model lookup. A
+    failure marks the job 'failed' with the error. If the job was requeued
+    (``requeue_stale``) while it ran, its fingerprints are rolled back so
+    the runner that claimed it next does not store them twice. Returns
+    False when the job was not queued or no longer belonged to this runner.
+    """
+    started_at = claim_job(job_id)
+    if started_at is None:
+        return False
+    job = db.session.get(Fingerprint_job, job_id)
+    try:
+        node_id = db.session.query(Mg_session.node_id).filter_by(session_id=job.session_id).scalar()
+        windows = windowed_statistics(session_readings(job.session_id), job.window_size, job.stride)
+        if not len(windows):
+            raise ValueError("Not enough data to form a complete window")
+        fingerprint_ids = insert_fingerprints(node_id, windows, job.window_size)
+        if not finish_job(job_id, started_at, status='done', fingerprint_count=len(fingerprint_ids)):
+            db.session.rollback()
+            logger.warning("Fingerprint job %s was requeued while running; discarded its fingerprints", job_id)
+            return False
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        finish_job(job_id, started_at, status='failed', error=str(e) or type(e).__name__)
+        db.session.commit()
+        logger.exception("Fingerprint job %s failed", job_id)
+        return True
+
+    node = db.session.get(Node, node_id)
+    if node:
+        append_fingerprints(node.floor_id, fingerprint_ids, windows, [node.node_id] * len(fingerprint_ids))
+    else:
+        invalidate_fingerprints(None)
+    return True
+
+
+def run_pending(limit=None):
+    """Run queued jobs, oldest first, in the calling thread; returns how many ran."""
+    query = db.session.query(Fingerprint_job.job_id).filter_by(status='queued').order_by(Fingerprint_job.created_at)
+    if limit is not None:
+        query = query.limit(limit)
+    return sum(run_job(job_id) for (job_id,) in query.all())
+
+
+def requeue_stale(seconds):
+    """Put jobs stuck in 'running' for over ``seconds`` back in the queue; returns how many."""
+    result = db.session.execute(
+        db.update(Fingerprint_job)
+        .where(Fingerprint_job.status == 'running', Fingerprint_job.started_at < datetime.utcnow() - timedelta(seconds=seconds))
+        .values(status='queued', started_at=None)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def job_details(job):
+    return {
+        'job_id': job.job_id,
+        'status': job.status,
+        'session_id': job.session_id,
+        'fingerprints': job.fingerprint_count,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
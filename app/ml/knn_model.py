@@ -1,41 +1,310 @@
+import io
 import numpy as np
 from collections import Counter
+from app.spatial import KDTree
 
 # KNN Classifier Implementation
 
+# Upper bound on query x train x feature differences held in memory at once
+CHUNK_ELEMENTS = 1 << 22
+
+# Query rows per block when merging k-d tree and appended-row results
+CHUNK_ROWS = 256
+
+# Search modes: 'brute' scans every fingerprint, 'kdtree' queries a k-d tree
+SEARCH_MODES = ('brute', 'kdtree')
+
+# Voting: 'uniform' counts each neighbour once, 'distance' weighs it by 1 / distance
+WEIGHT_MODES = ('uniform', 'distance')
+
+# Binary readings uploads: packed little-endian float32 x, y, z triplets, or a NumPy .npy file
+BINARY_FORMATS = ('float32', 'npy')
+
 class KNNModel:
-    def __init__(self, k=3):
+    """k-nearest-neighbour classifier over fingerprint feature vectors.
+
+    Rows added with ``partial_fit`` are searched by brute force next to
+    the k-d tree until ``compact`` rebuilds the tree over all of them.
+    Training data and the tree are each published as one tuple, so a
+    ``predict`` running in another thread always sees a consistent model.
+
+    With ``standardize`` every feature is scaled to zero mean and unit
+    variance (fitted on the training rows), so the small std features weigh
+    as much as the mean magnitudes. ``dtype`` sets the storage and distance
+    precision; float32 halves memory and bandwidth.
+    """
+
+    def __init__(self, k=3, search='brute', leaf_size=32, standardize=False, weights='uniform', dtype='float64'):
+        if search not in SEARCH_MODES:
+            raise ValueError(f"search must be one of: {', '.join(SEARCH_MODES)}")
+        if weights not in WEIGHT_MODES:
+            raise ValueError(f"weights must be one of: {', '.join(WEIGHT_MODES)}")
         self.k = k
+        self.search = search
+        self.leaf_size = leaf_size
+        self.standardize = standardize
+        self.weights = weights
+        self.dtype = np.dtype(dtype)
+        self.mean_ = None
+        self.scale_ = None
+        self._data = (np.empty((0, 6), dtype=self.dtype), np.empty(0))
+        self._buffers = self._data
+        self._index = (None, 0)
         
-    def fit(self, X, y):
-        self.X_train = X
-        self.y_train = y
-    
+    def fit(self, X, y, tree=None):
+        """Train on ``X``/``y``; a prebuilt ``tree`` over ``X`` is used as is."""
+        X = np.asarray(X, dtype=np.float64)
+        if self.standardize:
+            self.mean_ = X.mean(axis=0) if len(X) else np.zeros(X.shape[1])
+            scale = X.std(axis=0) if len(X) else np.ones(X.shape[1])
+            self.scale_ = np.where(scale > 0, scale, 1.0)
+        self.restore(self.transform(X), y, tree)
+
+    def restore(self, X, y, tree=None, mean=None, scale=None):
+        """Use already transformed rows as is, e.g. from a model artifact."""
+        if mean is not None:
+            self.mean_, self.scale_ = np.asarray(mean), np.asarray(scale)
+        X = np.asarray(X, dtype=self.dtype)
+        y = np.asarray(y)
+        self._buffers = self._data = (X, y)
+        self._index = (None, 0)
+        if self.search == 'kdtree':
+            self._index = (tree if tree is not None else KDTree(X, self.leaf_size), len(X))
+
+    def transform(self, X):
+        """Feature rows as stored: standardized if enabled, in ``dtype``."""
+        X = np.asarray(X, dtype=np.float64)
+        if self.mean_ is not None:
+            X = (X - self.mean_) / self.scale_
+        return np.ascontiguousarray(X, dtype=self.dtype)
+
+    def partial_fit(self, X, y):
+        """Append training rows without rebuilding the index.
+
+        Callers must not run ``partial_fit`` concurrently with itself.
+        Standardization keeps the parameters fitted by ``fit``.
+        """
+        X = self.transform(np.asarray(X, dtype=np.float64).reshape(-1, self._buffers[0].shape[1]))
+        y = np.asarray(y)
+        if not len(X):
+            return
+        n = len(self._data[0])
+        X_buffer, y_buffer = self._buffers
+        # Read-only buffers (memory-mapped artifacts) are copied on first append
+        if n + len(X) > len(X_buffer) or not X_buffer.flags.writeable:
+            # Grow geometrically so appends stay amortized O(rows added)
+            capacity = max(2 * len(X_buffer), n + len(X), 64)
+            X_buffer = np.empty((capacity, X_buffer.shape[1]), dtype=X_buffer.dtype)
+            y_buffer = np.empty(capacity, dtype=np.result_type(self._data[1], y))
+            X_buffer[:n] = self._data[0]
+            y_buffer[:n] = self._data[1]
+            self._buffers = (X_buffer, y_buffer)
+        X_buffer[n:n + len(X)] = X
+        y_buffer[n:n + len(X)] = y
+        self._data = (X_buffer[:n + len(X)], y_buffer[:n + len(X)])
+
+    def compact(self, search=None):
+        """Rebuild the k-d tree over every row, optionally switching ``search``."""
+        if search is not None:
+            self.search = search
+        X_train, _ = self._data
+        if self.search == 'kdtree':
+            self._index = (KDTree(X_train, self.leaf_size), len(X_train))
+        else:
+            self._index = (None, 0)
+
+    @property
+    def X_train(self):
+        return self._data[0]
+
+    @property
+    def y_train(self):
+        return self._data[1]
+
+    @property
+    def tree(self):
+        return self._index[0]
+
+    @property
+    def pending(self):
+        """Rows not yet covered by the k-d tree; 0 in brute-force mode."""
+        tree, indexed = self._index
+        return len(self._data[0]) - indexed if tree is not None else 0
+
+    @property
+    def nbytes(self):
+        tree = self._index[0]
+        size = self._buffers[0].nbytes + self._buffers[1].nbytes
+        return size + (tree.nbytes if tree is not None else 0)
+
     def predict(self, X):
-        predictions = [self._predict(x) for x in X]
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) == 0:
+            return np.array([])
+        X = self.transform(X)
+        X_train, y_train = self._data
+        predictions = []
+        for x, row in zip(X, self._neighbors(X, X_train, self._index)):
+            distances = None
+            if self.weights == 'distance':
+                distances = np.sqrt(np.sum((X_train[row] - x) ** 2, axis=1))
+            predictions.append(self.vote([y_train[i] for i in row], distances))
         return np.array(predictions)
-    
+
+    def kneighbors(self, X):
+        """``(labels, distances)`` of the k nearest training rows per query row, nearest first."""
+        X = self.transform(X)
+        X_train, y_train = self._data
+        result = []
+        for x, row in zip(X, self._neighbors(X, X_train, self._index)):
+            result.append((y_train[row], np.sqrt(np.sum((X_train[row] - x) ** 2, axis=1))))
+        return result
+
+    def vote(self, labels, distances=None):
+        """Winning label of nearest-first neighbours; ties go to the nearer label.
+
+        With distance weights, neighbours at distance 0 outvote all others.
+        """
+        if self.weights == 'uniform' or distances is None:
+            # Return the most common class label
+            return Counter(labels).most_common(1)[0][0]
+        distances = np.asarray(distances, dtype=np.float64)
+        weights = (distances == 0).astype(np.float64) if (distances == 0).any() else 1.0 / distances
+        totals = {}
+        for label, weight in zip(labels, weights.tolist()):
+            totals[label] = totals.get(label, 0.0) + weight
+        return max(totals, key=totals.get)
+
+    def _neighbors(self, X, X_train, index):
+        """Indices of the k nearest training rows for each query row, nearest first.
+
+        The k-d tree breaks distance ties by the lower training index; brute
+        force keeps the order of ``np.argsort``. Rows appended after the tree
+        was built are scanned and merged in by ``(distance, index)``.
+        """
+        tree, indexed = index
+        if tree is None:
+            for distances in self._distance_chunks(X, X_train):
+                yield from self._nearest(distances)
+            return
+
+        pending = X_train[indexed:]
+        for start in range(0, len(X), CHUNK_ROWS):
+            block = X[start:start + CHUNK_ROWS]
+            found = [tree.query(x, self.k) for x in block]
+            if not len(pending):
+                yield from (indices for _, indices in found)
+                continue
+            distances = np.vstack(list(self._distance_chunks(block, pending)))
+            for (tree_distances, tree_indices), pending_indices, row in zip(found, self._nearest(distances), distances):
+                candidates = np.concatenate([tree_indices, pending_indices + indexed])
+                candidate_distances = np.concatenate([tree_distances, row[pending_indices]])
+                yield candidates[np.lexsort((candidates, candidate_distances))][:self.k]
+
     def _predict(self, x):
-        # Compute distances between x and all examples in the training set
-        distances = [np.sqrt(np.sum((x - x_val) ** 2)) for x_val in self.X_train]
-        
-        # Sort by distance and return indices of the first k neighbors
-        k_indices = np.argsort(distances)[:self.k]
-        
-        # Extract the labels of the k nearest neighbors
-        k_nearest_labels = [self.y_train[i] for i in k_indices]
-        
-        # Return the most common class label
-        most_common = Counter(k_nearest_labels).most_common(1)
-        return most_common[0][0]
-
-
-def windowed_statistics(X, window_size):
-    X_windows = []
-    for i in range(0, len(X), window_size):
-        X_win = X[i:i+window_size]
-        if len(X_win) == window_size:
-            mean = np.mean(X_win, axis=0)
-            std = np.std(X_win, axis=0)
-            X_windows.append(np.concatenate([mean, std]))
-    return np.array(X_windows)
\ No newline at end of file
+        return self.predict([x])[0]
+
+    def _distance_chunks(self, X, X_train):
+        """Query x train distance matrices, a block of query rows at a time.
+
+        Each block holds at most CHUNK_ELEMENTS differences, and every
+        distance is computed exactly as ``np.sqrt(np.sum((x - x_val) ** 2))``.
+        """
+        rows = max(1, CHUNK_ELEMENTS // max(X_train.size, 1))
+        for start in range(0, len(X), rows):
+            diff = X[start:start + rows, None, :] - X_train[None, :, :]
+            yield np.sqrt(np.sum(diff ** 2, axis=2))
+
+    def _nearest(self, distances):
+        """Indices of the k nearest training rows for each row of ``distances``.
+
+        Top-k comes from ``argpartition``. Rows with tied distances at or
+        inside the top k are re-sorted with ``np.argsort`` over the whole
+        row, so the neighbours and their order match a full sort.
+        """
+        k = min(self.k, distances.shape[1])
+        if k == 0:
+            return np.zeros((len(distances), 0), dtype=np.intp)
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_distances = np.take_along_axis(top_distances, order, axis=1)
+
+        tied = np.count_nonzero(distances <= top_distances[:, -1:], axis=1) > k
+        tied |= np.any(top_distances[:, 1:] == top_distances[:, :-1], axis=1)
+        for i in np.flatnonzero(tied):
+            top[i] = np.argsort(distances[i])[:k]
+        return top
+
+
+def readings_to_array(readings):
+    """``(n, 3)`` float array of ``mag_x, mag_y, mag_z`` from reading dicts."""
+    values = (r[axis] for r in readings for axis in ('mag_x', 'mag_y', 'mag_z'))
+    return np.fromiter(values, dtype=np.float64, count=3 * len(readings)).reshape(-1, 3)
+
+
+def decode_readings(body, fmt='float32'):
+    """``(n, 3)`` array viewing a binary readings upload, without copying.
+
+    ``'float32'`` bodies are packed little-endian ``x, y, z`` triplets.
+    ``'npy'`` bodies are ``.npy`` files of any float dtype and shape
+    ``(n, 3)``; only the header is parsed. Raises ValueError on anything
+    else.
+    """
+    if fmt == 'float32':
+        if len(body) % 12:
+            raise ValueError("Binary readings must be float32 x, y, z triplets")
+        return np.frombuffer(body, dtype='<f4').reshape(-1, 3)
+    if fmt != 'npy':
+        raise ValueError(f"Unknown readings format {fmt!r}")
+
+    stream = io.BytesIO(body)
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    else:
+        raise ValueError(f"Unsupported .npy version {version}")
+    if dtype.kind != 'f' or len(shape) != 2 or shape[1] != 3:
+        raise ValueError("Readings must be a float array of shape (n, 3)")
+    if len(body) - stream.tell() < shape[0] * 3 * dtype.itemsize:
+        raise ValueError("Truncated .npy body")
+
+    readings = np.frombuffer(body, dtype=dtype, count=shape[0] * 3, offset=stream.tell())
+    if fortran_order:
+        return readings.reshape(shape[::-1]).T
+    return readings.reshape(shape)
+
+
+def windowed_statistics(X, window_size, stride=None):
+    """Per-window ``[mean_x, mean_y, mean_z, std_x, std_y, std_z]`` rows.
+
+    Windows start every ``stride`` samples (default ``window_size``, i.e.
+    non-overlapping) and a trailing partial window is dropped.
+    Non-overlapping windows are a reshape of the input; overlapping ones
+    are computed from cumulative sums, so every extra window costs O(1).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    stride = window_size if stride is None else stride
+    if X.ndim != 2 or len(X) < window_size or window_size < 1 or stride < 1:
+        return np.array([])
+
+    if stride == window_size:
+        count = len(X) // window_size
+        windows = X[:count * window_size].reshape(count, window_size, X.shape[1])
+        return np.concatenate([windows.mean(axis=1), windows.std(axis=1)], axis=1)
+
+    # Center first so the sum of squares does not cancel catastrophically
+    offset = X.mean(axis=0)
+    X = X - offset
+    sums = np.zeros((len(X) + 1, X.shape[1]))
+    squares = np.zeros((len(X) + 1, X.shape[1]))
+    np.cumsum(X, axis=0, out=sums[1:])
+    np.cumsum(X ** 2, axis=0, out=squares[1:])
+
+    starts = np.arange(0, len(X) - window_size + 1, stride)
+    mean = (sums[starts + window_size] - sums[starts]) / window_size
+    variance = (squares[starts + window_size] - squares[starts]) / window_size - mean ** 2
+    return np.concatenate([mean + offset, np.sqrt(np.maximum(variance, 0))], axis=1)
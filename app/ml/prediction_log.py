@@ -0,0 +1,169 @@
+import atexit
+import logging
+import random
+import threading
+from collections import deque
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Localization_log
+
+# Localization_log writes batched off the request thread
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionLog:
+    """Bounded in-memory buffer of predictions, flushed by a daemon thread.
+
+    ``record`` never touches the database. Once the buffer is more than
+    three quarters full new entries are sampled, with a keep probability
+    falling linearly to zero at ``capacity``, so a slow database sheds
+    load instead of blocking requests or growing memory. The writer
+    inserts up to ``batch_size`` rows per executemany round-trip.
+    """
+
+    def __init__(self, capacity=10000, batch_size=500, interval=1.0):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.interval = interval
+        self.enabled = True
+        self.app = None
+        self.written = 0
+        self.dropped = 0
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('LOCALIZATION_LOG_ENABLED', True)
+        self.capacity = app.config.get('LOCALIZATION_LOG_BUFFER', 10000)
+        self.batch_size = app.config.get('LOCALIZATION_LOG_BATCH', 500)
+        self.interval = app.config.get('LOCALIZATION_LOG_FLUSH_INTERVAL', 1.0)
+
+    def record(self, model_id, predicted_node_id, actual_node_id=None):
+        """Queue one prediction; returns False when it was dropped or logging is off.
+
+        ``model_id`` is None for models trained from the fingerprint table.
+        """
+        if not self.enabled or self.app is None:
+            return False
+        entry = {
+            'model_id': None if model_id is None else int(model_id),
+            'predicted_node_id': int(predicted_node_id),
+            'actual_node_id': None if actual_node_id is None else int(actual_node_id),
+            'timestamp': datetime.utcnow(),
+        }
+        with self._lock:
+            if not self._admit(len(self._buffer)):
+                self.dropped += 1
+                return False
+            self._buffer.append(entry)
+            full_batch = len(self._buffer) >= self.batch_size
+            self._start()
+        if full_batch:
+            self._wake.set()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {'queued': len(self._buffer), 'written': self.written, 'dropped': self.dropped}
+
+    def flush(self):
+        """Write everything queued so far; returns the number of rows inserted."""
+        inserted = 0
+        while True:
+            with self._lock:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            if not batch:
+                return inserted
+            with self.app.app_context():
+                written = self._write(batch)
+            inserted += written
+            with self._lock:
+                self.written += written
+                self.dropped += len(batch) - written
+
+    def _write(self, batch):
+        """Insert a batch; returns how many entries were written."""
+        try:
+            db.session.execute(db.insert(Localization_log), batch)
+            db.session.commit()
+            return len(batch)
+        except IntegrityError as e:
+            db.session.rollback()
+            if len(batch) == 1:
+                logger.warning("Dropped localization log entry %s: %s", batch[0], e.orig)
+                return 0
+        except Exception:
+            db.session.rollback()
+            logger.exception("Failed to write %d localization log entries", len(batch))
+            return 0
+        # One entry breaking a constraint, e.g. for a node deleted since, must not cost the rest
+        return sum(self._write([entry]) for entry in batch)
+
+    def _admit(self, queued):
+        high_water = self.capacity * 3 // 4
+        if queued < high_water:
+            return True
+        if queued >= self.capacity:
+            return False
+        return random.random() < (self.capacity - queued) / (self.capacity - high_water)
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            if self._thread is None:
+                # Write what is still queued when the worker shuts down
+                atexit.register(self.flush)
+            self._thread = threading.Thread(target=self._run, name='localization-log', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Localization log writer failed")
+
+
+prediction_log = PredictionLog()
+
+
+def accuracy_rollup(model_id=None, since=None):
+    """Logged predictions per model, with accuracy over the labelled ones.
+
+    Only entries with an ``actual_node_id`` count towards accuracy, which
+    is None for a model without any. Predictions of models trained from the
+    fingerprint table are grouped under a ``model_id`` of None.
+    """
+    labelled_count = db.func.count(Localization_log.actual_node_id)
+    correct_count = db.func.sum(db.case((Localization_log.predicted_node_id == Localization_log.actual_node_id, 1), else_=0))
+    query = db.session.query(
+        Localization_log.model_id,
+        db.func.count(Localization_log.log_id),
+        labelled_count,
+        correct_count,
+        db.func.min(Localization_log.timestamp),
+        db.func.max(Localization_log.timestamp),
+    )
+    if model_id is not None:
+        query = query.filter(Localization_log.model_id == model_id)
+    if since is not None:
+        query = query.filter(Localization_log.timestamp >= since)
+
+    rollup = []
+    for model, predictions, labelled, correct, first, last in query.group_by(Localization_log.model_id).order_by(Localization_log.model_id):
+        rollup.append({
+            'model_id': model,
+            'predictions': predictions,
+            'labelled': labelled,
+            'correct': int(correct or 0),
+            'accuracy': (correct or 0) / labelled if labelled else None,
+            'first_prediction': first.isoformat() if first else None,
+            'last_prediction': last.isoformat() if last else None,
+        })
+    return rollup
@@ -0,0 +1,250 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from flask import current_app
+from app import db
+from app.models import Floor, Mg_Fingerprint, Node
+from app.ml.artifacts import FEATURES, artifact_store
+from app.ml.knn_model import KNNModel
+from app.pathfinding.cache import graph_cache
+
+# Localization models partitioned by building and floor, kept in the graph cache
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-compact')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def model_key(scope):
+    return ('model',) + tuple(scope)
+
+
+def get_model(scope=('all',)):
+    """Trained KNNModel for ``('floor', id)``, ``('building', id)`` or ``('all',)``.
+
+    Returns None when the partition has no fingerprints. A partition is
+    retrained after one of its floors loses nodes or its building's floors
+    change (``invalidate_nodes``, ``invalidate_building``); edge and
+    geometry edits leave it alone. A cached model first appends the fingerprints other
+    processes committed since it was built, see ``catch_up``. Each model
+    records the ``fingerprint_ids`` it was trained on, so rows committed
+    out of id order are still added exactly once.
+    """
+    key = model_key(scope)
+    model = graph_cache.get(key)
+    if model is not None:
+        catch_up(key, scope, model)
+        return model
+
+    # Read versions and the table state before the rows so a concurrent upload makes this build stale
+    depends_on = partition_versions(scope)
+    state = fingerprint_table_state()
+    artifact = artifact_store.current
+    # Fingerprints added since the build are read from the table, so only membership changes rule the artifact out
+    if artifact is not None and not any(v for k, v in depends_on.items() if k[0] != 'fingerprints'):
+        # Nothing in this partition changed since startup: start from the
+        # mapped artifact and add the fingerprints it does not contain
+        artifact_ids = artifact.fingerprint_ids(scope)
+        fingerprint_ids, X_new, y_new = load_missing(scope, artifact_ids)
+        model = artifact.model(scope, search_mode(len(artifact_ids) + len(X_new)))
+        model.fingerprint_ids = artifact_ids
+        extend_model(model, fingerprint_ids, X_new, y_new)
+        model.model_id = artifact.model_id
+        if not len(model.X_train):
+            return None
+    else:
+        fingerprint_ids, X_train, y_train = load_fingerprints(scope)
+        if not len(X_train):
+            return None
+        model = KNNModel(k=3, search=search_mode(len(X_train)), **model_options())
+        model.fit(X_train, y_train)
+        model.fingerprint_ids = fingerprint_ids
+        model.model_id = None  # Not registered in ML_model; predictions are logged without a model id
+    model.table_state = state
+    model.checked_at = time.monotonic()
+
+    graph_cache.put(key, model, graph_cache.version(key), depends_on)
+    return model
+
+
+def model_options():
+    """KNNModel options from KNN_STANDARDIZE, KNN_WEIGHTS and KNN_DTYPE."""
+    return {
+        'standardize': current_app.config.get('KNN_STANDARDIZE', False),
+        'weights': current_app.config.get('KNN_WEIGHTS', 'uniform'),
+        'dtype': current_app.config.get('KNN_DTYPE', 'float64'),
+    }
+
+
+def search_mode(rows):
+    search = current_app.config.get('KNN_SEARCH', 'auto')
+    if search == 'auto':
+        search = 'kdtree' if rows >= current_app.config.get('KNN_TREE_MIN_ROWS', 5000) else 'brute'
+    return search
+
+
+def partition_versions(scope):
+    if scope[0] == 'all':
+        return {('members',): graph_cache.version(('members',)), ('fingerprints',): graph_cache.version(('fingerprints',))}
+
+    versions = {}
+    if scope[0] == 'floor':
+        floor_ids = [int(scope[1])]
+    else:
+        versions[('building', int(scope[1]))] = graph_cache.version(('building', int(scope[1])))
+        floor_ids = [f for (f,) in db.session.query(Floor.floor_id).filter_by(building_id=scope[1])]
+    for floor_id in floor_ids:
+        versions[('members', floor_id)] = graph_cache.version(('members', floor_id))
+        versions[('fingerprints', floor_id)] = graph_cache.version(('fingerprints', floor_id))
+    return versions
+
+
+def scope_query(scope, *columns):
+    """Query of ``columns`` restricted to the fingerprints of a partition."""
+    query = db.session.query(*columns)
+    if scope[0] == 'floor':
+        query = query.join(Node, Node.node_id == Mg_Fingerprint.node_id).filter(Node.floor_id == scope[1])
+    elif scope[0] == 'building':
+        query = (
+            query.join(Node, Node.node_id == Mg_Fingerprint.node_id)
+            .join(Floor, Floor.floor_id == Node.floor_id)
+            .filter(Floor.building_id == scope[1])
+        )
+    return query
+
+
+def load_fingerprints(scope, after=None):
+    """``(fingerprint_ids, X, y)`` arrays for a partition, in fingerprint_id order.
+
+    ``after`` restricts the rows to fingerprint ids above it.
+    """
+    query = scope_query(scope, *FEATURES, Mg_Fingerprint.node_id, Mg_Fingerprint.fingerprint_id)
+    if after is not None:
+        query = query.filter(Mg_Fingerprint.fingerprint_id > after)
+    rows = query.order_by(Mg_Fingerprint.fingerprint_id).all()
+    X_train = np.array([row[:6] for row in rows], dtype=np.float64).reshape(-1, 6)
+    y_train = np.array([row[6] for row in rows])
+    fingerprint_ids = np.array([row[7] for row in rows], dtype=np.int64)
+    return fingerprint_ids, X_train, y_train
+
+
+def load_missing(scope, known_ids):
+    """``load_fingerprints`` for the rows of a partition whose ids are not in sorted ``known_ids``."""
+    scope_ids = np.array([i for (i,) in scope_query(scope, Mg_Fingerprint.fingerprint_id)], dtype=np.int64)
+    missing = np.setdiff1d(scope_ids, known_ids)
+    if not len(missing):
+        return np.empty(0, dtype=np.int64), np.empty((0, 6)), np.empty(0, dtype=np.int64)
+    fingerprint_ids, X, y = load_fingerprints(scope, after=int(missing[0]) - 1)
+    keep = np.isin(fingerprint_ids, missing)
+    return fingerprint_ids[keep], X[keep], y[keep]
+
+
+def fingerprint_table_state():
+    """``(count, max id)`` of the fingerprint table; changes whenever a row is committed."""
+    return tuple(db.session.query(db.func.count(Mg_Fingerprint.fingerprint_id), db.func.max(Mg_Fingerprint.fingerprint_id)).one())
+
+
+def catch_up(key, scope, model):
+    """Append fingerprints committed by other processes to a cached model.
+
+    Uploads handled by this worker reach its models through
+    ``append_fingerprints``. Those stored by other workers or by
+    `flask ml work` are only in the table, so at most once per
+    GRAPH_CACHE_SYNC_INTERVAL a lookup compares the table's row count and
+    newest id with the state the model last saw. When they differ, the
+    partition's ids are diffed against ``model.fingerprint_ids``, which
+    also finds rows committed after others with a higher id.
+    """
+    now = time.monotonic()
+    if now - model.checked_at < graph_cache.sync_interval:
+        return
+    model.checked_at = now
+    state = fingerprint_table_state()
+    if state == model.table_state:
+        return
+    fingerprint_ids, X_new, y_new = load_missing(scope, model.fingerprint_ids)
+    added = []
+
+    def apply(cached):
+        added.append(extend_model(cached, fingerprint_ids, X_new, y_new))
+        cached.table_state = state
+
+    if graph_cache.update(key, apply) and any(added):
+        schedule_rebuilds([model])
+
+
+def extend_model(model, fingerprint_ids, X, y):
+    """``partial_fit`` the rows whose ids are not in ``model.fingerprint_ids``.
+
+    Returns whether any row was added.
+    """
+    new = ~np.isin(fingerprint_ids, model.fingerprint_ids)
+    if not new.any():
+        return False
+    model.partial_fit(X[new], y[new])
+    model.fingerprint_ids = np.union1d(model.fingerprint_ids, fingerprint_ids[new])
+    return True
+
+
+def schedule_rebuilds(models):
+    """Compact models whose k-d tree lags too far behind or whose search mode changed."""
+    threshold = current_app.config.get('KNN_REBUILD_PENDING', 1000)
+    for model in models:
+        search = search_mode(len(model.X_train))
+        if model.pending >= threshold or search != model.search:
+            schedule_compaction(model, search)
+
+
+def append_fingerprints(floor_id, fingerprint_ids, X, y):
+    """Add committed fingerprints to every cached model that covers ``floor_id``.
+
+    Models are updated in place with ``partial_fit``. Rows whose ids a model
+    already has (it was built or caught up after the commit) are skipped.
+    Once a model's k-d tree lags KNN_REBUILD_PENDING rows behind, or an
+    'auto' model outgrows brute force, the tree is rebuilt in the background.
+    """
+    fingerprint_ids = np.asarray(fingerprint_ids, dtype=np.int64)
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y)
+    updated = []
+
+    def apply(key, model):
+        if key[0] != 'model':
+            return False
+        extend_model(model, fingerprint_ids, X, y)
+        updated.append(model)
+        return True
+
+    graph_cache.patch(('fingerprints', int(floor_id)), apply)
+    graph_cache.patch(('fingerprints',), apply)
+    schedule_rebuilds(updated)
+
+
+def schedule_compaction(model, search=None):
+    """Rebuild ``model``'s index off the request thread; queued at most once."""
+    with _pending_lock:
+        if id(model) in _pending:
+            return
+        _pending.add(id(model))
+    _executor.submit(_compact, model, search)
+
+
+def _compact(model, search):
+    with _pending_lock:
+        _pending.discard(id(model))
+    try:
+        model.compact(search)
+    except Exception:
+        logger.exception("Failed to compact localization model")
+
+
+def invalidate_fingerprints(*floor_ids):
+    """Retrain the partitions covering these floors (and the global model) on next use."""
+    graph_cache.bump(('fingerprints',))
+    for floor_id in set(floor_ids):
+        if floor_id is not None:
+            graph_cache.bump(('fingerprints', int(floor_id)))
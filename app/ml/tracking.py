@@ -0,0 +1,151 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import numpy as np
+from app.ml.knn_model import windowed_statistics
+
+# Streaming localization: per-session HMM over the nodes of a floor or building
+
+# Probability mass spread evenly over all nodes in every emission, so a
+# node the KNN never votes for can still be reached
+EMISSION_FLOOR = 0.05
+
+
+class TrackingSession:
+    """Rolling reading buffer and node belief of one client.
+
+    Each complete window is scored by the KNN model and combined with a
+    motion model in which a user either stays on a node or moves to one of
+    its neighbours in the routing graph, so the estimate only jumps
+    between unconnected nodes on sustained evidence.
+    """
+
+    def __init__(self, scope, window_size=3, stride=None, stay_probability=0.6):
+        self.session_id = str(uuid.uuid4())
+        self.scope = tuple(scope)
+        self.window_size = window_size
+        self.stride = stride or window_size
+        self.stay_probability = stay_probability
+        self.buffer = np.empty((0, 3))
+        self.node_ids = np.empty(0, dtype=np.int64)
+        self.belief = np.empty(0)
+        self.windows = 0
+        self.lock = threading.Lock()
+        self.touched = time.monotonic()
+
+    def update(self, readings, model, graph, node_ids):
+        """Consume an ``(n, 3)`` chunk of readings; returns the windows processed.
+
+        ``graph`` is the CSRGraph of the session scope and ``node_ids`` the
+        sorted ids of every node in it (the HMM states).
+        """
+        self._align(node_ids)
+        if not len(self.node_ids):
+            return 0
+        self.buffer = np.concatenate([self.buffer, np.asarray(readings, dtype=np.float64).reshape(-1, 3)])
+        windows = windowed_statistics(self.buffer, self.window_size, self.stride)
+        if not len(windows):
+            return 0
+        self.buffer = self.buffer[len(windows) * self.stride:]
+
+        tails, heads, stay = self._transitions(graph)
+        for labels, distances in model.kneighbors(windows):
+            # Motion: stay, or move to an open neighbour with equal probability
+            moved = self.belief * stay
+            np.add.at(moved, heads, self.belief[tails] * (1 - self.stay_probability) / self._degree[tails])
+            self.belief = moved * self._emission(model, labels, distances)
+            self.belief /= self.belief.sum()
+        self.windows += len(windows)
+        return len(windows)
+
+    def estimate(self):
+        """``(node_id, probability)`` of the most likely node, or None before any window."""
+        if not self.windows or not len(self.belief):
+            return None
+        i = int(np.argmax(self.belief))
+        return int(self.node_ids[i]), float(self.belief[i])
+
+    def _align(self, node_ids):
+        """Carry the belief over when nodes were added to or removed from the scope."""
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        if np.array_equal(node_ids, self.node_ids):
+            return
+        belief = np.full(len(node_ids), 1.0 / max(len(node_ids), 1))
+        if self.windows and len(self.node_ids) and len(node_ids):
+            positions = np.searchsorted(self.node_ids, node_ids).clip(max=len(self.node_ids) - 1)
+            known = self.node_ids[positions] == node_ids
+            if known.any():
+                belief = np.where(known, self.belief[positions], 0.0) + 1e-12
+                belief /= belief.sum()
+        self.node_ids, self.belief = node_ids, belief
+
+    def _transitions(self, graph):
+        """Open arcs of ``graph`` as state indices, plus the stay probability per state."""
+        tails = np.repeat(np.arange(len(graph.node_ids)), np.diff(graph.offsets))
+        heads = graph.targets.astype(np.int64)
+        states = np.searchsorted(self.node_ids, graph.node_ids).clip(max=max(len(self.node_ids) - 1, 0))
+        present = self.node_ids[states] == graph.node_ids if len(self.node_ids) else np.zeros(len(states), dtype=bool)
+
+        keep = np.isfinite(graph.weights) & (tails != heads) & present[tails] & present[heads]
+        tails, heads = states[tails[keep]], states[heads[keep]]
+        self._degree = np.bincount(tails, minlength=len(self.node_ids)).astype(np.float64)
+        stay = np.where(self._degree > 0, self.stay_probability, 1.0)
+        self._degree[self._degree == 0] = 1.0
+        return tails, heads, stay
+
+    def _emission(self, model, labels, distances):
+        votes = np.zeros(len(self.node_ids))
+        weights = np.ones(len(labels)) if model.weights == 'uniform' else 1.0 / np.maximum(distances, 1e-9)
+        positions = np.searchsorted(self.node_ids, labels).clip(max=len(self.node_ids) - 1)
+        known = self.node_ids[positions] == labels
+        np.add.at(votes, positions[known], weights[known])
+        if votes.sum() > 0:
+            votes /= votes.sum()
+        return (1 - EMISSION_FLOOR) * votes + EMISSION_FLOOR / len(votes)
+
+
+class SessionStore:
+    """Tracking sessions of this process, expired after ``ttl`` idle seconds."""
+
+    def __init__(self, ttl=300, max_sessions=10000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('LOCALIZE_SESSION_TTL', 300)
+        self.max_sessions = app.config.get('LOCALIZE_MAX_SESSIONS', 10000)
+
+    def add(self, session):
+        with self._lock:
+            self._expire()
+            self._sessions[session.session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.touched = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def remove(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.touched >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+
+
+session_store = SessionStore()
@@ -15,7 +15,7 @@ class Node(db.Model):
     x_coordinate = db.Column(db.Float, nullable=False)
     y_coordinate = db.Column(db.Float, nullable=False)
     node_type = db.Column(db.String(50), nullable=False)
-    floor_id = db.Column(db.Integer, db.ForeignKey('floor.floor_id'), nullable=False)
+    floor_id = db.Column(db.Integer, db.ForeignKey('floor.floor_id'), nullable=False, index=True)
     # connecter_id = db.Column(db.String(100), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -24,12 +24,14 @@ class Edge(db.Model):
     start_node_id = db.Column(db.Integer, db.ForeignKey('node.node_id'), nullable=False)
     end_node_id = db.Column(db.Integer, db.ForeignKey('node.node_id'), nullable=False)
     distance = db.Column(db.Float, nullable=False)
-    floor_id = db.Column(db.Integer, db.ForeignKey('floor.floor_id'), nullable=False)
+    floor_id = db.Column(db.Integer, db.ForeignKey('floor.floor_id'), nullable=False, index=True)
     is_walkable = db.Column(db.Boolean, default=True)
     # edge_type = db.Column(db.String(50), nullable=False, default='horizontal')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
 class Floor(db.Model):
+    # Floors of a building, already in floor_number order
+    __table_args__ = (db.Index('ix_floor_building_id_floor_number', 'building_id', 'floor_number'),)
     floor_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     building_id = db.Column(db.Integer, db.ForeignKey('building.building_id'), nullable=False)
     floor_number = db.Column(db.Integer, nullable=False)
@@ -46,6 +48,8 @@ class Building(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
 class Mg_Raw_Reading(db.Model):
+    # Readings of a session, already in reading_id order
+    __table_args__ = (db.Index('ix_mg__raw__reading_session_id_reading_id', 'session_id', 'reading_id'),)
     reading_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     session_id = db.Column(db.String(100), db.ForeignKey('mg_session.session_id'), nullable=False)
     mag_x = db.Column(db.Float, nullable=False)
@@ -56,11 +60,31 @@ class Mg_Raw_Reading(db.Model):
 class Mg_session(db.Model):
     session_id = db.Column(db.String(100), primary_key=True)
     node_id = db.Column(db.Integer, db.ForeignKey('node.node_id'), nullable=False)
+    # Packed samples (app.ml.ingest.pack_readings); NULL for sessions stored as Mg_Raw_Reading rows
+    readings = db.Column(db.LargeBinary, nullable=True)
+    reading_count = db.Column(db.Integer, nullable=True)
+    recorded_at = db.Column(db.DateTime, default=datetime.utcnow)
     # device_id = db.Column(db.String(100), nullable=False)
     # started_at = db.Column(db.DateTime, default=datetime.utcnow)
     # ended_at = db.Column(db.DateTime, nullable=True)
     
+class Fingerprint_job(db.Model):
+    # Queued jobs, oldest first
+    __table_args__ = (db.Index('ix_fingerprint_job_status_created_at', 'status', 'created_at'),)
+    job_id = db.Column(db.String(100), primary_key=True)
+    session_id = db.Column(db.String(100), db.ForeignKey('mg_session.session_id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    window_size = db.Column(db.Integer, nullable=False)
+    stride = db.Column(db.Integer, nullable=True)
+    fingerprint_count = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
 class Mg_Fingerprint(db.Model):
+    # Fingerprints of a node, already in fingerprint_id order
+    __table_args__ = (db.Index('ix_mg__fingerprint_node_id_fingerprint_id', 'node_id', 'fingerprint_id'),)
     fingerprint_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     node_id = db.Column(db.Integer, db.ForeignKey('node.node_id'), nullable=False)
     mean_x = db.Column(db.Float, nullable=False)
@@ -77,11 +101,22 @@ class ML_model(db.Model):
     model_type = db.Column(db.String(100), nullable=False)
     window_size = db.Column(db.Integer, nullable=False)
     accuracy = db.Column(db.Float, nullable=False)
+    latency_ms = db.Column(db.Float, nullable=True)
+    parameters = db.Column(db.JSON, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
 class Localization_log(db.Model):
+    # Accuracy rollups per model and time range
+    __table_args__ = (db.Index('ix_localization_log_model_id_timestamp', 'model_id', 'timestamp'),)
     log_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    model_id = db.Column(db.Integer, db.ForeignKey('ml_model.model_id'), nullable=False)
+    # NULL for models trained from the fingerprint table instead of a registered artifact
+    model_id = db.Column(db.Integer, db.ForeignKey('ml_model.model_id'), nullable=True)
     predicted_node_id = db.Column(db.Integer, db.ForeignKey('node.node_id'), nullable=False)
     actual_node_id = db.Column(db.Integer, db.ForeignKey('node.node_id'), nullable=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    
+class Cache_version(db.Model):
+    # Versions of cached graph scopes shared by all workers, e.g. 'floor:3'
+    key = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
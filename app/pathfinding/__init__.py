@@ -1,4 +1,16 @@
-from .dijkstra import findpath
-from .build_graph import build_graph
+from .dijkstra import findpath, findpath_bidirectional, shortest_path_tree, ALGORITHMS
+from .astar import findpath_astar
+from .build_graph import build_graph, build_building_graph, build_node_table, build_spatial_index, load_floor_graph, load_building_graph
+from .cache import graph_cache, invalidate_floor, invalidate_building, invalidate_nodes, set_edge_walkable
+from .csr import CSRGraph
+from .nodes import NodeIndex, NodeTable, node_details
+from .contraction import ContractionHierarchy
+from .precompute import build_hierarchy, get_hierarchy, schedule_hierarchy
+from .matrix import distance_matrix
 
-__all__ = ['findpath', 'build_graph']
\ No newline at end of file
+__all__ = [
+    'findpath', 'findpath_bidirectional', 'findpath_astar', 'shortest_path_tree', 'distance_matrix', 'ALGORITHMS',
+    'build_graph', 'build_building_graph', 'build_node_table', 'build_spatial_index', 'load_floor_graph', 'load_building_graph',
+    'graph_cache', 'invalidate_floor', 'invalidate_building', 'invalidate_nodes', 'set_edge_walkable', 'CSRGraph', 'NodeTable', 'NodeIndex', 'node_details',
+    'ContractionHierarchy', 'build_hierarchy', 'get_hierarchy', 'schedule_hierarchy',
+]
@@ -0,0 +1,62 @@
+import heapq
+import numpy as np
+from app.pathfinding.dijkstra import findpath_csr, unwind_path
+
+def findpath_astar(start_node, end_node, graph, stats=None):
+    """A* over a CSRGraph using scaled straight-line distance to the target.
+
+    The heuristic is only a lower bound when no edge is shorter than the
+    straight line between its endpoints; graphs that fail that check (or
+    lack coordinates) are searched with plain Dijkstra instead.
+    """
+    if stats is None:
+        stats = {}
+    if not graph.heuristic_admissible:
+        return findpath_csr(start_node, end_node, graph, stats)
+
+    stats['algorithm'] = 'astar'
+    stats['expanded'] = 0
+
+    if start_node == end_node:
+        return 0, [start_node]
+
+    source = graph.index_of(start_node)
+    target = graph.index_of(end_node)
+    if source is None or target is None:
+        return float('inf'), []
+
+    # One vectorized pass gives the heuristic for every index
+    heuristic = np.hypot(*(graph.coords - graph.coords[target]).T).tolist()
+
+    n = len(graph)
+    distances = [float('inf')] * n
+    previous = [-1] * n
+    distances[source] = 0
+    pq = [(heuristic[source], source)]
+
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+
+    while pq:
+        estimate, current = heapq.heappop(pq)
+
+        if current == target:
+            break
+
+        current_distance = distances[current]
+        if estimate > current_distance + heuristic[current]:
+            continue
+        stats['expanded'] += 1
+
+        lo, hi = offsets[current], offsets[current + 1]
+        for neighbor, weight in zip(targets[lo:hi].tolist(), weights[lo:hi].tolist()):
+            distance = current_distance + weight
+
+            if distance < distances[neighbor]:
+                distances[neighbor] = distance
+                previous[neighbor] = current
+                heapq.heappush(pq, (distance + heuristic[neighbor], neighbor))
+
+    if distances[target] == float('inf'):
+        return float('inf'), []  # No path found
+
+    return distances[target], unwind_path(previous, target, graph.node_ids)
@@ -1,29 +1,210 @@
 from collections import defaultdict
-from app.models import Edge, Floor
+import numpy as np
+from flask import current_app
+from app import db
+from app.models import Building, Edge, Floor, Node
+from app.pathfinding.cache import graph_cache
+from app.pathfinding.csr import CSRGraph
+from app.pathfinding.nodes import NodeIndex, NodeTable
+
+# Fallback for the CONNECTOR_COSTS setting
+DEFAULT_CONNECTOR_COSTS = {'stairs': 15.0, 'elevator': 10.0}
 
 def build_graph(floor_id):
+    key = ('floor', int(floor_id))
+    graph = graph_cache.get(key)
+    if graph is not None:
+        return graph
+
+    # Read the version before hitting the database so a concurrent write
+    # makes this build stale instead of silently overwriting the newer map
+    depends_on = scope_versions(key, walkability=True)
+    version = depends_on.pop(key)
+    graph = load_floor_graph(
+        floor_id,
+        current_app.config.get('GRAPH_REPRESENTATION', 'csr'),
+        build_node_table(key),
+    )
+    graph_cache.put(key, graph, version, depends_on)
+    return graph
+
+def build_building_graph(building_id):
+    key = ('building', int(building_id))
+    graph = graph_cache.get(key)
+    if graph is not None:
+        return graph
+
+    # The building graph is stale as soon as any of its floors changes
+    depends_on = scope_versions(key, walkability=True)
+    version = depends_on.pop(key)
+    graph = load_building_graph(
+        building_id,
+        current_app.config.get('GRAPH_REPRESENTATION', 'csr'),
+        current_app.config.get('CONNECTOR_COSTS', DEFAULT_CONNECTOR_COSTS),
+        build_node_table(key),
+    )
+    graph_cache.put(key, graph, version, depends_on)
+    return graph
+
+def build_node_table(key):
+    """Cached NodeTable for a ``('floor', id)`` or ``('building', id)`` scope."""
+    cache_key = ('nodes',) + tuple(key)
+    table = graph_cache.get(cache_key)
+    if table is not None:
+        return table
+
+    depends_on = scope_versions(key)
+    scope, scope_id = key
+    if scope == 'floor':
+        table = load_node_table([scope_id])
+    else:
+        table = load_node_table([f for (f,) in db.session.query(Floor.floor_id).filter_by(building_id=scope_id)])
+    graph_cache.put(cache_key, table, graph_cache.version(cache_key), depends_on)
+    return table
+
+def build_spatial_index(floor_id):
+    """Cached NodeIndex of a floor, rebuilt after any node write on it."""
+    key = ('spatial', 'floor', int(floor_id))
+    index = graph_cache.get(key)
+    if index is not None:
+        return index
+
+    depends_on = scope_versions(key[1:])
+    index = NodeIndex(build_node_table(key[1:]))
+    graph_cache.put(key, index, graph_cache.version(key), depends_on)
+    return index
+
+def scope_versions(key, walkability=False):
+    """Versions of ``key`` and, for a building, of each of its floors.
+
+    With ``walkability`` the per-floor edge closure markers are included
+    too, so graphs can be patched in place when an edge is closed.
+    """
+    versions = {key: graph_cache.version(key)}
+    floor_ids = [key[1]] if key[0] == 'floor' else []
+    if key[0] == 'building':
+        floor_ids = [f for (f,) in db.session.query(Floor.floor_id).filter_by(building_id=key[1])]
+        for floor_id in floor_ids:
+            versions[('floor', floor_id)] = graph_cache.version(('floor', floor_id))
+    if walkability:
+        for floor_id in floor_ids:
+            versions[('walkable', floor_id)] = graph_cache.version(('walkable', floor_id))
+    return versions
+
+def load_node_table(floor_ids):
+    rows = db.session.query(
+        Node.node_id, Node.name, Node.x_coordinate, Node.y_coordinate, Node.node_type, Node.floor_id
+    ).filter(Node.floor_id.in_(floor_ids)).all()
+    return NodeTable(rows)
+
+def load_floor_graph(floor_id, representation='csr', nodes=None):
     edges = Edge.query.filter_by(floor_id=floor_id).all()
     floor = Floor.query.get(floor_id)
     if not floor:
         raise ValueError("Floor not found")
     scale = floor.scale if floor.scale else 1.0
-    
+
     edges = [
         {
+            'edge_id': edge.edge_id,
             'from': edge.start_node_id,
             'to': edge.end_node_id,
-            'weight': edge.distance * scale
+            'weight': edge.distance * scale,
+            'walkable': edge.is_walkable is not False
         } for edge in edges
     ]
-    
+
+    if representation != 'csr':
+        return compile_graph(edges, None, representation)
+    if nodes is None:
+        nodes = load_node_table([floor_id])
+    return compile_graph(edges, (nodes.node_ids, nodes.x * scale, nodes.y * scale), representation)
+
+def load_building_graph(building_id, representation='csr', connector_costs=DEFAULT_CONNECTOR_COSTS, nodes=None):
+    """Graph of every floor in a building, joined through connector nodes.
+
+    Connector nodes (``node_type`` listed in ``connector_costs``) on
+    consecutive floors are linked when they share type and name, or when
+    each floor has exactly one connector of that type.
+    """
+    if not Building.query.get(building_id):
+        raise ValueError("Building not found")
+    floors = Floor.query.filter_by(building_id=building_id).order_by(Floor.floor_number).all()
+    scales = {f.floor_id: (f.scale if f.scale else 1.0) for f in floors}
+
+    edges = [
+        {
+            'edge_id': edge.edge_id,
+            'from': edge.start_node_id,
+            'to': edge.end_node_id,
+            'weight': edge.distance * scales[edge.floor_id],
+            'walkable': edge.is_walkable is not False
+        } for edge in Edge.query.filter(Edge.floor_id.in_(scales)).all()
+    ]
+
+    if nodes is None:
+        nodes = load_node_table(list(scales))
+    edges.extend(connector_edges(floors, nodes.rows, connector_costs))
+
+    node_scales = np.array([scales.get(f, 1.0) for f in nodes.floor_ids.tolist()])
+    return compile_graph(edges, (nodes.node_ids, nodes.x * node_scales, nodes.y * node_scales), representation)
+
+def connector_edges(floors, rows, connector_costs):
+    """Vertical edges between matching connectors on consecutive floors.
+
+    ``rows`` are NodeTable rows: ``(node_id, name, x, y, node_type, floor_id)``.
+    """
+    connectors = defaultdict(list)
+    for row in rows:
+        node_type = (row[4] or '').strip().lower()
+        if node_type in connector_costs:
+            connectors[(row[5], node_type)].append(row)
+
+    edges = []
+    for lower, upper in zip(floors, floors[1:]):
+        span = abs(upper.floor_number - lower.floor_number) or 1
+        for node_type, cost in connector_costs.items():
+            below = connectors.get((lower.floor_id, node_type), [])
+            above = connectors.get((upper.floor_id, node_type), [])
+            if len(below) == 1 and len(above) == 1:
+                pairs = [(below[0], above[0])]
+            else:
+                by_name = {row[1].strip().lower(): row for row in above}
+                pairs = [(row, by_name[row[1].strip().lower()]) for row in below if row[1].strip().lower() in by_name]
+            edges.extend(
+                {'edge_id': -1, 'from': a[0], 'to': b[0], 'weight': cost * span, 'walkable': True}
+                for a, b in pairs
+            )
+    return edges
+
+def compile_graph(edges, positions, representation='csr'):
+    """Turn edge dicts into a CSRGraph, or the adjacency dict for 'dict'.
+
+    ``positions`` is a ``(node_ids, xs, ys)`` triple already scaled to real
+    distance and is only used by the CSR layout. Edges that are not
+    walkable are left out of the dict graph and kept closed in the CSR one.
+    """
+    if representation == 'csr':
+        graph = CSRGraph.from_edges(
+            [edge['from'] for edge in edges],
+            [edge['to'] for edge in edges],
+            [edge['weight'] for edge in edges],
+            [edge['edge_id'] for edge in edges],
+            [edge['walkable'] for edge in edges],
+        )
+        graph.attach_coordinates(*positions)
+        return graph
+
     graph = defaultdict(list)
-    
+
     for edge in edges:
+        if not edge['walkable']:
+            continue
         u = edge['from']
         v = edge['to']
         weight = edge['weight']
-        
+
         graph[u].append((v, weight))
         graph[v].append((u, weight))
-        
-    return graph
\ No newline at end of file
+
+    return graph
@@ -0,0 +1,370 @@
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from flask import has_app_context
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Cache_version
+from app.pathfinding.csr import CSRGraph
+
+# In-process cache of compiled graphs, kept in step across workers through the cache_version table
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Separate budget for localization models, keyed ('model', ...)
+DEFAULT_MODEL_MAX_BYTES = 512 * 1024 * 1024
+
+# Seconds between reads of the shared versions
+DEFAULT_SYNC_INTERVAL = 1.0
+
+
+def estimate_size(graph):
+    """Rough memory footprint of a compiled graph in bytes."""
+    if hasattr(graph, 'nbytes'):
+        return int(graph.nbytes)
+
+    size = sys.getsizeof(graph)
+    for node, neighbors in graph.items():
+        size += sys.getsizeof(node) + sys.getsizeof(neighbors)
+        for pair in neighbors:
+            size += sys.getsizeof(pair) + sum(sys.getsizeof(v) for v in pair)
+    return size
+
+
+class _Entry:
+    __slots__ = ('version', 'graph', 'nbytes', 'depends_on', 'pool')
+
+    def __init__(self, version, graph, nbytes, depends_on, pool=None):
+        self.version = version
+        self.graph = graph
+        self.nbytes = nbytes
+        self.depends_on = depends_on
+        self.pool = pool
+
+
+class GraphCache:
+    """LRU cache of compiled graphs keyed by scope, e.g. ``('floor', 3)``.
+
+    Every key carries a version stamp that is bumped on writes. An entry is
+    only served while the version it was built against is still current, so
+    a build that races with a write is never returned once the write lands.
+    Entries may also depend on the versions of other keys, e.g. a building
+    graph on each of its floors. Entries are evicted least-recently-used
+    first once the summed size goes over ``max_bytes``. Keys whose first
+    element is listed in ``budgets`` (e.g. ``'model'``) are counted and
+    evicted against their own limit instead. An entry larger than its
+    limit is not cached, and a warning is logged.
+
+    Versions are local to the worker. Writes also bump a shared version in
+    the database (see ``publish_versions``), and ``sync_versions`` bumps the
+    local keys that other workers moved since it last looked.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, sync_interval=DEFAULT_SYNC_INTERVAL, budgets=None):
+        self.max_bytes = max_bytes
+        self.budgets = dict(budgets or {})
+        self.sync_interval = sync_interval
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._shared = None
+        self._synced_at = None
+        self._lock = threading.RLock()
+        self.current_bytes = 0
+        self.pool_bytes = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('GRAPH_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+        self.budgets['model'] = app.config.get('MODEL_CACHE_MAX_BYTES', DEFAULT_MODEL_MAX_BYTES)
+        self.sync_interval = app.config.get('GRAPH_CACHE_SYNC_INTERVAL', DEFAULT_SYNC_INTERVAL)
+        app.before_request(sync_versions)
+
+    def version(self, key):
+        return self._versions.get(key, 0)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not self._current(key, entry):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.graph
+
+    def put(self, key, graph, version, depends_on=None):
+        """Store ``graph`` as built against ``version`` of ``key``.
+
+        ``depends_on`` maps other keys to the versions read before the build.
+        """
+        nbytes = estimate_size(graph)
+        pool = key[0] if key[0] in self.budgets else None
+        entry = _Entry(version, graph, nbytes, dict(depends_on or {}), pool)
+        limit = self.limit(pool)
+        if nbytes > limit:
+            logger.warning("Not caching %s: %d bytes is over the %d byte budget", key, nbytes, limit)
+            return
+        with self._lock:
+            if not self._current(key, entry):
+                return
+            self._discard(key)
+            self._entries[key] = entry
+            self._resize(entry, 0, nbytes)
+            while self.pool_bytes[pool] > limit:
+                oldest = next(k for k, e in self._entries.items() if e.pool == pool)
+                if oldest == key:
+                    break
+                self._discard(oldest)
+                self.evictions += 1
+
+    def limit(self, pool=None):
+        """Byte budget of a pool; None is the default pool of compiled graphs."""
+        return self.budgets[pool] if pool is not None else self.max_bytes
+
+    def dependencies(self, key):
+        """Versions a value derived from the entry at ``key`` should depend on."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not self._current(key, entry):
+                return None
+            return {key: entry.version, **entry.depends_on}
+
+    def dependents(self, key):
+        """Keys of cached entries built against ``key``, current or not."""
+        with self._lock:
+            return [k for k, entry in self._entries.items() if key in entry.depends_on]
+
+    def patch(self, key, apply):
+        """Bump ``key`` but keep entries that ``apply`` can update in place.
+
+        ``apply(entry_key, value)`` is called under the lock for every current
+        entry that depends on ``key`` and returns True once the value reflects
+        the change; entries it returns False for are dropped. Returns the keys
+        that were dropped.
+        """
+        with self._lock:
+            affected = self.dependents(key)
+            self._versions[key] = self.version(key) + 1
+            dropped = []
+            for k in affected:
+                entry = self._entries[k]
+                stale = entry.version != self.version(k) or any(
+                    self.version(d) != v for d, v in entry.depends_on.items() if d != key
+                )
+                if not stale and apply(k, entry.graph):
+                    entry.depends_on[key] = self.version(key)
+                    # Values that grew in place (e.g. appended rows) are re-measured
+                    self._resize(entry, entry.nbytes, estimate_size(entry.graph))
+                else:
+                    self._discard(k)
+                    dropped.append(k)
+            return dropped
+
+    def update(self, key, apply):
+        """Call ``apply(value)`` under the lock on the current entry at ``key``.
+
+        For in-place changes that move no version, e.g. rows committed by
+        another process. Returns False when the entry is missing or stale.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not self._current(key, entry):
+                return False
+            apply(entry.graph)
+            self._resize(entry, entry.nbytes, estimate_size(entry.graph))
+            return True
+
+    def bump(self, key):
+        with self._lock:
+            self._versions[key] = self.version(key) + 1
+            self._discard(key)
+            for dependent in self.dependents(key):
+                self._discard(dependent)
+
+    def sync_due(self):
+        """True at most once every ``sync_interval`` seconds."""
+        with self._lock:
+            now = time.monotonic()
+            if self._synced_at is not None and now - self._synced_at < self.sync_interval:
+                return False
+            self._synced_at = now
+            return True
+
+    def observe(self, shared):
+        """Record the shared versions; returns the keys that moved since the last call.
+
+        The first call only records, since nothing was cached against the
+        versions before it.
+        """
+        with self._lock:
+            previous = self._shared
+            self._shared = dict(shared)
+            if previous is None:
+                return []
+            return [key for key, version in shared.items() if previous.get(key, 0) != version]
+
+    def acknowledge(self, key, version):
+        """Record a shared bump made by this worker, which it has already applied locally."""
+        with self._lock:
+            if self._shared is not None and self._shared.get(key, 0) == version - 1:
+                self._shared[key] = version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.pool_bytes.clear()
+
+    def reset(self):
+        """Forget entries, versions, shared versions and counters, as in a fresh worker."""
+        with self._lock:
+            self.clear()
+            self._versions.clear()
+            self._shared = None
+            self._synced_at = None
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.pool_bytes.get(None, 0),
+                "max_bytes": self.max_bytes,
+                "budgets": {pool: {"bytes": self.pool_bytes.get(pool, 0), "max_bytes": limit} for pool, limit in self.budgets.items()},
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _current(self, key, entry):
+        if entry.version != self.version(key):
+            return False
+        return all(self.version(k) == v for k, v in entry.depends_on.items())
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._resize(entry, entry.nbytes, 0)
+
+    def _resize(self, entry, old, new):
+        entry.nbytes = new
+        self.current_bytes += new - old
+        self.pool_bytes[entry.pool] = self.pool_bytes.get(entry.pool, 0) + new - old
+
+
+graph_cache = GraphCache()
+
+
+def invalidate_floor(*floor_ids):
+    """Bump the version of every given floor so its graph is rebuilt on next use."""
+    _invalidate([('floor', int(f)) for f in set(floor_ids) if f is not None])
+
+
+def invalidate_building(*building_ids):
+    """Bump buildings whose set of floors changed."""
+    _invalidate([('building', int(b)) for b in set(building_ids) if b is not None])
+
+
+def invalidate_nodes(*floor_ids):
+    """Bump the node membership of floors that lost nodes, deleted or moved away.
+
+    Localization models depend on this key rather than on the floor graph,
+    so edge and geometry edits do not retrain them.
+    """
+    _invalidate([('members',)] + [('members', int(f)) for f in set(floor_ids) if f is not None])
+
+
+def set_edge_walkable(floor_id, edge_id, walkable):
+    """Apply an edge closure or reopening to every cached graph of a floor.
+
+    CSR graphs (the floor's and those of buildings containing it) are
+    patched in place. Dict graphs and hierarchies built on the old weights
+    are dropped, and the hierarchies are queued for a rebuild. Node tables
+    and the floor version stay untouched. Other workers drop their graphs
+    of the floor on their next ``sync_versions``.
+    """
+    from app.pathfinding.precompute import schedule_hierarchy  # Import here to avoid circular imports
+
+    def apply(key, graph):
+        return isinstance(graph, CSRGraph) and graph.set_walkable(edge_id, walkable)
+
+    dropped = graph_cache.patch(('walkable', int(floor_id)), apply)
+    schedule_hierarchy(*(k[1:] for k in dropped if k[0] == 'hierarchy'))
+    publish_versions([('walkable', int(floor_id))])
+
+
+def version_name(key):
+    """Row key of a cache key in cache_version, e.g. ``'floor:3'``."""
+    return ':'.join(str(part) for part in key)
+
+
+def parse_version_name(name):
+    scope, *ids = name.split(':')
+    return (scope,) + tuple(int(i) for i in ids)
+
+
+def publish_versions(keys):
+    """Bump the shared versions of ``keys`` after a committed write.
+
+    Other workers see the bump on their next ``sync_versions``. Does
+    nothing outside an application context.
+    """
+    if not keys or not has_app_context():
+        return
+    names = sorted({version_name(key) for key in keys})
+    for attempt in range(2):
+        try:
+            now = datetime.utcnow()
+            db.session.execute(
+                db.update(Cache_version)
+                .where(Cache_version.key.in_(names))
+                .values(version=Cache_version.version + 1, updated_at=now)
+            )
+            existing = {name for (name,) in db.session.query(Cache_version.key).filter(Cache_version.key.in_(names))}
+            db.session.add_all(Cache_version(key=name, version=1, updated_at=now) for name in names if name not in existing)
+            db.session.commit()
+            break
+        except IntegrityError:
+            # Another worker created one of the rows first; the retry updates it
+            db.session.rollback()
+            if attempt:
+                raise
+    for name, version in db.session.query(Cache_version.key, Cache_version.version).filter(Cache_version.key.in_(names)):
+        graph_cache.acknowledge(parse_version_name(name), version)
+
+
+def sync_versions():
+    """Apply the invalidations other workers published since the last check.
+
+    Runs before every request and reads the cache_version table at most
+    every GRAPH_CACHE_SYNC_INTERVAL seconds, so a write on one worker
+    reaches the others within that interval.
+    """
+    if not graph_cache.sync_due():
+        return
+    shared = {parse_version_name(name): version for name, version in db.session.query(Cache_version.key, Cache_version.version)}
+    changed = graph_cache.observe(shared)
+    if changed:
+        _invalidate(changed, publish=False)
+
+
+def _invalidate(keys, publish=True):
+    from app.pathfinding.precompute import schedule_hierarchy  # Import here to avoid circular imports
+
+    # Rebuild the hierarchies that were serving the old version of these graphs
+    stale = set()
+    for key in keys:
+        stale.update(k[1:] for k in graph_cache.dependents(key) if k[0] == 'hierarchy')
+        graph_cache.bump(key)
+    schedule_hierarchy(*stale)
+    if publish:
+        publish_versions(keys)
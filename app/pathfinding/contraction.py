@@ -0,0 +1,203 @@
+import heapq
+import sys
+import numpy as np
+
+# Contraction hierarchy over a CSRGraph
+
+WITNESS_SETTLE_LIMIT = 64
+
+
+class ContractionHierarchy:
+    """Shortcut index that answers point-to-point queries on a fixed graph.
+
+    Nodes are contracted one by one in order of importance (edge difference
+    plus contracted neighbours). Contracting a node adds a shortcut between
+    two of its neighbours whenever no witness path avoiding it is as short.
+    Queries then run a bidirectional Dijkstra that only climbs to
+    higher-ranked nodes, which settles a few dozen nodes on venue-sized
+    graphs instead of most of the floor.
+    """
+
+    def __init__(self, graph):
+        self.node_ids = graph.node_ids
+        n = len(graph)
+
+        adj = [dict() for _ in range(n)]
+        for u in range(n):
+            for v, weight in graph.neighbors(u):
+                if v != u and weight != float('inf') and weight < adj[u].get(v, float('inf')):
+                    adj[u][v] = weight
+                    adj[v][u] = weight
+
+        self._middle = {}
+        self.rank = [0] * n
+        deleted_neighbors = [0] * n
+        upward = [None] * n
+
+        heap = [(self._priority(adj, v, deleted_neighbors), v) for v in range(n)]
+        heapq.heapify(heap)
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            # Lazy update: re-queue if the node became more important
+            priority = self._priority(adj, v, deleted_neighbors)
+            if heap and priority > heap[0][0]:
+                heapq.heappush(heap, (priority, v))
+                continue
+
+            for u, x, distance in self._shortcuts(adj, v):
+                if distance < adj[u].get(x, float('inf')):
+                    adj[u][x] = distance
+                    adj[x][u] = distance
+                    self._middle[(min(u, x), max(u, x))] = v
+
+            upward[v] = adj[v]
+            for u in adj[v]:
+                del adj[u][v]
+                deleted_neighbors[u] += 1
+            adj[v] = {}
+            self.rank[v] = order
+            order += 1
+
+        counts = [len(up) for up in upward]
+        self.offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.targets = np.fromiter((u for up in upward for u in up), dtype=np.int32, count=self.offsets[-1])
+        self.weights = np.fromiter((w for up in upward for w in up.values()), dtype=np.float64, count=self.offsets[-1])
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    @property
+    def shortcut_count(self):
+        return len(self._middle)
+
+    @property
+    def nbytes(self):
+        return (
+            self.offsets.nbytes + self.targets.nbytes + self.weights.nbytes
+            + sys.getsizeof(self._middle) + 8 * len(self.rank)
+        )
+
+    def index_of(self, node_id):
+        i = int(np.searchsorted(self.node_ids, node_id))
+        if i < len(self.node_ids) and self.node_ids[i] == node_id:
+            return i
+        return None
+
+    def query(self, start_node, end_node, stats=None):
+        """Shortest path as ``(distance, path)``, same contract as findpath."""
+        if stats is None:
+            stats = {}
+        stats['algorithm'] = 'ch'
+        stats['expanded'] = 0
+
+        if start_node == end_node:
+            return 0, [start_node]
+
+        source = self.index_of(start_node)
+        target = self.index_of(end_node)
+        if source is None or target is None:
+            return float('inf'), []
+
+        # The graph is undirected, so both directions climb the same upward arcs
+        distances = ({source: 0}, {target: 0})
+        previous = ({source: -1}, {target: -1})
+        queues = ([(0, source)], [(0, target)])
+        best, meeting = float('inf'), -1
+
+        while queues[0] or queues[1]:
+            tops = [q[0][0] if q else float('inf') for q in queues]
+            if min(tops) >= best:
+                break
+            side = 0 if tops[0] <= tops[1] else 1
+            current_distance, current = heapq.heappop(queues[side])
+            if current_distance > distances[side][current]:
+                continue
+            stats['expanded'] += 1
+
+            other = distances[1 - side].get(current)
+            if other is not None and current_distance + other < best:
+                best, meeting = current_distance + other, current
+
+            lo, hi = self.offsets[current], self.offsets[current + 1]
+            for neighbor, weight in zip(self.targets[lo:hi].tolist(), self.weights[lo:hi].tolist()):
+                distance = current_distance + weight
+                if distance < distances[side].get(neighbor, float('inf')):
+                    distances[side][neighbor] = distance
+                    previous[side][neighbor] = current
+                    heapq.heappush(queues[side], (distance, neighbor))
+
+        if meeting == -1:
+            return float('inf'), []  # No path found
+
+        forward = self._trace(previous[0], meeting)
+        forward.reverse()
+        backward = self._trace(previous[1], meeting)
+        hops = forward + backward[1:]
+
+        path = [hops[0]]
+        for a, b in zip(hops, hops[1:]):
+            path.extend(self._unpack(a, b))
+        return best, [int(self.node_ids[i]) for i in path]
+
+    @staticmethod
+    def _trace(previous, node):
+        hops = []
+        while node != -1:
+            hops.append(node)
+            node = previous[node]
+        return hops
+
+    def _unpack(self, a, b):
+        """Original nodes after ``a`` up to and including ``b``."""
+        nodes = []
+        stack = [(a, b)]
+        while stack:
+            u, v = stack.pop()
+            via = self._middle.get((min(u, v), max(u, v)))
+            if via is None:
+                nodes.append(v)
+            else:
+                stack.append((via, v))
+                stack.append((u, via))
+        return nodes
+
+    def _priority(self, adj, v, deleted_neighbors):
+        return len(self._shortcuts(adj, v)) - len(adj[v]) + deleted_neighbors[v]
+
+    @staticmethod
+    def _shortcuts(adj, v):
+        """Shortcuts ``(u, x, distance)`` needed if ``v`` were contracted now."""
+        neighbors = list(adj[v].items())
+        shortcuts = []
+        for i, (u, to_u) in enumerate(neighbors[:-1]):
+            rest = neighbors[i + 1:]
+            limit = to_u + max(w for _, w in rest)
+            witness = _witness_search(adj, u, v, limit)
+            for x, to_x in rest:
+                if witness.get(x, float('inf')) > to_u + to_x:
+                    shortcuts.append((u, x, to_u + to_x))
+        return shortcuts
+
+
+def _witness_search(adj, source, skip, limit):
+    """Bounded Dijkstra from ``source`` that never passes through ``skip``."""
+    distances = {source: 0}
+    pq = [(0, source)]
+    settled = 0
+    while pq and settled < WITNESS_SETTLE_LIMIT:
+        current_distance, current = heapq.heappop(pq)
+        if current_distance > limit:
+            break
+        if current_distance > distances[current]:
+            continue
+        settled += 1
+        for neighbor, weight in adj[current].items():
+            if neighbor == skip:
+                continue
+            distance = current_distance + weight
+            if distance < distances.get(neighbor, float('inf')):
+                distances[neighbor] = distance
+                heapq.heappush(pq, (distance, neighbor))
+    return distances
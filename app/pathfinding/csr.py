@@ -0,0 +1,179 @@
+import numpy as np
+
+# Compressed sparse row (CSR) adjacency for the pathfinding engine
+
+
+class CSRGraph:
+    """Undirected weighted graph stored as flat NumPy arrays.
+
+    Node ids are mapped to dense indices ``0..n-1`` in ascending id order.
+    The neighbours of index ``i`` are ``targets[offsets[i]:offsets[i + 1]]``
+    with matching ``weights``, in the same order ``build_graph`` used to
+    append them to the dict graph, so both representations settle ties the
+    same way.
+
+    ``coords`` optionally holds the scaled ``(x, y)`` position of every index
+    for heuristic search; ``heuristic_admissible`` records whether every
+    edge is at least as long as the straight line between its endpoints.
+
+    Graphs built with ``edge_ids`` remember where both arcs of every edge
+    live, so an edge can be closed (weight set to infinity) and reopened in
+    place without recompiling.
+    """
+
+    def __init__(self, node_ids, offsets, targets, weights, coords=None):
+        self.node_ids = node_ids
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.edge_ids = None
+        self.edge_arcs = None
+        self.edge_weights = None
+        self.coords = None
+        self.heuristic_admissible = False
+        if coords is not None:
+            self._set_coords(coords)
+
+    @classmethod
+    def from_edges(cls, sources, destinations, weights, edge_ids=None, walkable=None):
+        """Build from parallel sequences describing undirected edges.
+
+        Edges whose ``walkable`` flag is False are stored with infinite
+        weight so they can be reopened later with ``set_walkable``.
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        destinations = np.asarray(destinations, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+        current = weights
+        if walkable is not None:
+            current = np.where(np.asarray(walkable, dtype=bool), weights, np.inf)
+
+        # Interleave both directions edge by edge so each adjacency list
+        # keeps the insertion order of the dict graph
+        graph, positions = cls._from_arcs(
+            np.stack([sources, destinations], axis=1).ravel(),
+            np.stack([destinations, sources], axis=1).ravel(),
+            np.repeat(current, 2),
+        )
+        if edge_ids is not None:
+            graph.edge_ids = np.asarray(edge_ids, dtype=np.int64)
+            graph.edge_arcs = positions.reshape(-1, 2)
+            graph.edge_weights = weights
+        return graph
+
+    @classmethod
+    def from_arcs(cls, tails, heads, weights):
+        """Build from directed arcs, keeping their order within each tail."""
+        return cls._from_arcs(tails, heads, weights)[0]
+
+    @classmethod
+    def _from_arcs(cls, tails, heads, weights):
+        tails = np.asarray(tails, dtype=np.int64)
+        heads = np.asarray(heads, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+
+        node_ids = np.unique(np.concatenate([tails, heads]))
+        tail_index = np.searchsorted(node_ids, tails)
+        head_index = np.searchsorted(node_ids, heads)
+        order = np.argsort(tail_index, kind='stable')
+
+        offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tail_index, minlength=len(node_ids)), out=offsets[1:])
+
+        # positions[k] is where input arc k ended up in the CSR arrays
+        positions = np.empty_like(order)
+        positions[order] = np.arange(len(order))
+
+        graph = cls(node_ids, offsets, head_index[order].astype(np.int32), weights[order])
+        return graph, positions
+
+    @classmethod
+    def from_adjacency(cls, graph):
+        """Convert a dict graph as returned by ``load_floor_graph``."""
+        tails, heads, weights = [], [], []
+        for u, neighbors in graph.items():
+            for v, weight in neighbors:
+                tails.append(u)
+                heads.append(v)
+                weights.append(weight)
+        return cls.from_arcs(tails, heads, weights)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __contains__(self, node_id):
+        return self.index_of(node_id) is not None
+
+    @property
+    def nbytes(self):
+        size = (
+            self.node_ids.nbytes + self.offsets.nbytes
+            + self.targets.nbytes + self.weights.nbytes
+        )
+        if self.coords is not None:
+            size += self.coords.nbytes
+        if self.edge_ids is not None:
+            size += self.edge_ids.nbytes + self.edge_arcs.nbytes + self.edge_weights.nbytes
+        return size
+
+    def set_walkable(self, edge_id, walkable):
+        """Close or reopen an edge in place. Returns False if it is not in the graph."""
+        if self.edge_ids is None:
+            return False
+        rows = np.flatnonzero(self.edge_ids == edge_id)
+        if len(rows) == 0:
+            return False
+        for row in rows:
+            arcs = self.edge_arcs[row]
+            self.weights[arcs] = self.edge_weights[row] if walkable else np.inf
+            if walkable and self.heuristic_admissible:
+                tail = np.searchsorted(self.offsets, arcs[0], side='right') - 1
+                head = self.targets[arcs[0]]
+                straight = np.hypot(*(self.coords[tail] - self.coords[head]))
+                if self.edge_weights[row] < straight * (1 - 1e-9) - 1e-9:
+                    self.heuristic_admissible = False
+        return True
+
+    def attach_coordinates(self, node_ids, xs, ys, scale=1.0):
+        """Record node positions, converted to real distance with ``scale``.
+
+        Nodes without a position are left as NaN, which disables the
+        heuristic for the whole graph.
+        """
+        coords = np.full((len(self.node_ids), 2), np.nan)
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        idx = np.searchsorted(self.node_ids, node_ids)
+        idx = np.minimum(idx, max(len(self.node_ids) - 1, 0))
+        known = (self.node_ids[idx] == node_ids) if len(self.node_ids) else np.zeros(len(node_ids), bool)
+        coords[idx[known], 0] = np.asarray(xs, dtype=np.float64)[known] * scale
+        coords[idx[known], 1] = np.asarray(ys, dtype=np.float64)[known] * scale
+        self._set_coords(coords)
+
+    def _set_coords(self, coords):
+        self.coords = coords
+        if np.isnan(coords).any():
+            self.heuristic_admissible = False
+            return
+        # Straight-line distance is only a lower bound if no edge undercuts it
+        tails = np.repeat(np.arange(len(self.node_ids)), np.diff(self.offsets))
+        straight = np.hypot(*(coords[tails] - coords[self.targets]).T)
+        self.heuristic_admissible = bool(np.all(self.weights >= straight * (1 - 1e-9) - 1e-9))
+
+    def index_of(self, node_id):
+        """Dense index of ``node_id`` or None when it has no edges."""
+        i = int(np.searchsorted(self.node_ids, node_id))
+        if i < len(self.node_ids) and self.node_ids[i] == node_id:
+            return i
+        return None
+
+    def neighbors(self, i):
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return zip(self.targets[lo:hi].tolist(), self.weights[lo:hi].tolist())
+
+    def to_adjacency(self):
+        """Expand back into the dict-of-lists representation."""
+        ids = self.node_ids.tolist()
+        return {
+            ids[i]: [(ids[j], w) for j, w in self.neighbors(i)]
+            for i in range(len(ids))
+        }
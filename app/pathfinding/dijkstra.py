@@ -1,6 +1,37 @@
 import heapq
+from app.pathfinding.csr import CSRGraph
+from app.pathfinding.contraction import ContractionHierarchy
+
+ALGORITHMS = ('dijkstra', 'astar', 'ch', 'bidirectional')
+
+def findpath(start_node, end_node, graph, algorithm='dijkstra', stats=None):
+    """Shortest path between two node ids as ``(distance, path)``.
+
+    ``algorithm`` is 'dijkstra', 'bidirectional', 'astar' or 'ch'; A* needs a CSRGraph with
+    admissible coordinates and 'ch' needs ``graph`` to be a
+    ContractionHierarchy, otherwise Dijkstra runs. When ``stats`` is a dict it
+    receives the algorithm actually used and the expanded node count.
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown algorithm '{algorithm}'")
+    if stats is None:
+        stats = {}
+
+    if isinstance(graph, ContractionHierarchy):
+        return graph.query(start_node, end_node, stats)
+
+    if algorithm == 'bidirectional':
+        return findpath_bidirectional(start_node, end_node, graph, stats)
+
+    if isinstance(graph, CSRGraph):
+        if algorithm == 'astar':
+            from app.pathfinding.astar import findpath_astar  # Import here to avoid circular imports
+            return findpath_astar(start_node, end_node, graph, stats)
+        return findpath_csr(start_node, end_node, graph, stats)
+
+    stats['algorithm'] = 'dijkstra'
+    stats['expanded'] = 0
 
-def findpath(start_node, end_node, graph):
     pq = [(0, start_node)]  # priority queue of (cost, node)
     
     distances = {start_node: 0}
@@ -14,6 +45,7 @@ def findpath(start_node, end_node, graph):
         
         if current_distance > distances.get(current_node, float('inf')):
             continue
+        stats['expanded'] += 1
         
         for neighbor, weight in graph.get(current_node, []):
             distance = current_distance + weight
@@ -35,4 +67,169 @@ def findpath(start_node, end_node, graph):
         
     path.reverse()
     
-    return distances[end_node], path
\ No newline at end of file
+    return distances[end_node], path
+
+def findpath_csr(start_node, end_node, graph, stats=None):
+    if stats is None:
+        stats = {}
+    stats['algorithm'] = 'dijkstra'
+    stats['expanded'] = 0
+
+    if start_node == end_node:
+        return 0, [start_node]
+
+    source = graph.index_of(start_node)
+    target = graph.index_of(end_node)
+    if source is None or target is None:
+        return float('inf'), []
+
+    # Dense per-index state; plain lists are the fastest scalar access from Python
+    n = len(graph)
+    distances = [float('inf')] * n
+    previous = [-1] * n
+    distances[source] = 0
+    pq = [(0, source)]
+
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+
+    while pq:
+        current_distance, current = heapq.heappop(pq)
+
+        if current == target:
+            break
+
+        if current_distance > distances[current]:
+            continue
+        stats['expanded'] += 1
+
+        lo, hi = offsets[current], offsets[current + 1]
+        for neighbor, weight in zip(targets[lo:hi].tolist(), weights[lo:hi].tolist()):
+            distance = current_distance + weight
+
+            if distance < distances[neighbor]:
+                distances[neighbor] = distance
+                previous[neighbor] = current
+                heapq.heappush(pq, (distance, neighbor))
+
+    if distances[target] == float('inf'):
+        return float('inf'), []  # No path found
+
+    return distances[target], unwind_path(previous, target, graph.node_ids)
+
+def unwind_path(previous, target, node_ids):
+    """Follow predecessor indices back from ``target`` and map them to node ids."""
+    path = []
+    node = target
+    while node != -1:
+        path.append(int(node_ids[node]))
+        node = previous[node]
+    path.reverse()
+    return path
+
+def shortest_path_tree(source, graph, targets=None):
+    """Single-source Dijkstra over CSR indices.
+
+    Returns the ``(distances, previous)`` lists indexed like ``graph``.
+    When ``targets`` is given the search stops once all of them are settled.
+    """
+    n = len(graph)
+    distances = [float('inf')] * n
+    previous = [-1] * n
+    distances[source] = 0
+    pq = [(0, source)]
+    remaining = set(targets) if targets is not None else None
+
+    offsets, targets_, weights = graph.offsets, graph.targets, graph.weights
+
+    while pq:
+        current_distance, current = heapq.heappop(pq)
+
+        if current_distance > distances[current]:
+            continue
+
+        if remaining is not None:
+            remaining.discard(current)
+            if not remaining:
+                break
+
+        lo, hi = offsets[current], offsets[current + 1]
+        for neighbor, weight in zip(targets_[lo:hi].tolist(), weights[lo:hi].tolist()):
+            distance = current_distance + weight
+
+            if distance < distances[neighbor]:
+                distances[neighbor] = distance
+                previous[neighbor] = current
+                heapq.heappush(pq, (distance, neighbor))
+
+    return distances, previous
+
+def findpath_bidirectional(start_node, end_node, graph, stats=None):
+    """Dijkstra from both ends at once, meeting in the middle.
+
+    Works on both graph layouts and returns ``(distance, path)`` like
+    ``findpath``. The search stops once the two frontier minima together
+    reach the best connection found, so on long corridors it settles
+    roughly half the nodes of a one-sided search.
+    """
+    if stats is None:
+        stats = {}
+    stats['algorithm'] = 'bidirectional'
+    stats['expanded'] = 0
+
+    if start_node == end_node:
+        return 0, [start_node]
+
+    if isinstance(graph, CSRGraph):
+        source = graph.index_of(start_node)
+        target = graph.index_of(end_node)
+        if source is None or target is None:
+            return float('inf'), []
+        neighbors = graph.neighbors
+    else:
+        source, target = start_node, end_node
+        neighbors = lambda node: graph.get(node, [])
+
+    distances = ({source: 0}, {target: 0})
+    previous = ({source: None}, {target: None})
+    queues = ([(0, source)], [(0, target)])
+    best, meeting = float('inf'), None
+
+    while queues[0] and queues[1]:
+        if queues[0][0][0] + queues[1][0][0] >= best:
+            break
+        side = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+        current_distance, current = heapq.heappop(queues[side])
+        if current_distance > distances[side][current]:
+            continue
+        stats['expanded'] += 1
+
+        for neighbor, weight in neighbors(current):
+            distance = current_distance + weight
+            if distance < distances[side].get(neighbor, float('inf')):
+                distances[side][neighbor] = distance
+                previous[side][neighbor] = current
+                heapq.heappush(queues[side], (distance, neighbor))
+
+            # Every relaxed edge that touches the other search is a candidate
+            other = distances[1 - side].get(neighbor)
+            here = distances[side].get(neighbor, float('inf'))
+            if other is not None and here + other < best:
+                best, meeting = here + other, neighbor
+
+    if meeting is None:
+        return float('inf'), []  # No path found
+
+    path = []
+    node = meeting
+    while node is not None:
+        path.append(node)
+        node = previous[0][node]
+    path.reverse()
+    node = previous[1][meeting]
+    while node is not None:
+        path.append(node)
+        node = previous[1][node]
+
+    if isinstance(graph, CSRGraph):
+        path = [int(graph.node_ids[i]) for i in path]
+    return best, path
@@ -0,0 +1,74 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from app.pathfinding.csr import CSRGraph
+from app.pathfinding.dijkstra import shortest_path_tree, unwind_path
+
+# One-to-many / many-to-many distances over a single compiled graph
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(workers):
+    # Spawned, not forked: the web worker holds database connections and locks of other threads
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pools[workers]
+
+
+def distance_matrix(graph, sources, targets, include_paths=False, workers=1):
+    """Distances from every source node id to every target node id.
+
+    Runs one single-source search per source over the same graph; each
+    search stops as soon as all reachable targets are settled. Returns
+    ``(distances, paths)`` as row-per-source lists, with None for
+    unreachable pairs; ``paths`` is None unless ``include_paths`` is set.
+    When ``workers`` is above one the sources are split into one chunk per
+    worker process. The searches are pure Python, so threads would only
+    take turns on the GIL. Each chunk receives a pickled copy of the graph.
+    """
+    if not isinstance(graph, CSRGraph):
+        graph = CSRGraph.from_adjacency(graph)
+
+    target_indices = [graph.index_of(t) for t in targets]
+
+    if workers > 1 and len(sources) > 1:
+        size = -(-len(sources) // workers)
+        chunks = [sources[i:i + size] for i in range(0, len(sources), size)]
+        pool = _pool(workers)
+        futures = [pool.submit(_rows, graph, targets, target_indices, include_paths, chunk) for chunk in chunks]
+        rows = [row for future in futures for row in future.result()]
+    else:
+        rows = _rows(graph, targets, target_indices, include_paths, sources)
+
+    distances = [r[0] for r in rows]
+    paths = [r[1] for r in rows] if include_paths else None
+    return distances, paths
+
+
+def _rows(graph, targets, target_indices, include_paths, sources):
+    return [_row(graph, targets, target_indices, include_paths, source) for source in sources]
+
+
+def _row(graph, targets, target_indices, include_paths, source):
+    source_index = graph.index_of(source)
+    if source_index is None:
+        # Isolated nodes only reach themselves
+        distances = [0 if t == source else None for t in targets]
+        paths = [[source] if t == source else None for t in targets]
+        return distances, paths
+
+    wanted = [i for i in target_indices if i is not None]
+    tree_distances, previous = shortest_path_tree(source_index, graph, wanted)
+
+    distances, paths = [], []
+    for target, index in zip(targets, target_indices):
+        if index is None or tree_distances[index] == float('inf'):
+            distances.append(0 if target == source else None)
+            paths.append([source] if target == source else None)
+            continue
+        distances.append(tree_distances[index])
+        paths.append(unwind_path(previous, index, graph.node_ids) if include_paths else None)
+    return distances, paths
@@ -0,0 +1,94 @@
+import sys
+import numpy as np
+from app.spatial import KDTree
+
+# Node attributes for one floor or building, loaded alongside the graph
+
+
+class NodeTable:
+    """Every node of a floor or building, sorted by node_id.
+
+    Rows are ``(node_id, name, x_coordinate, y_coordinate, node_type,
+    floor_id)`` tuples; ids and positions are also kept as arrays so
+    lookups and scaling are vectorized.
+    """
+
+    def __init__(self, rows):
+        self.rows = sorted((tuple(r) for r in rows), key=lambda r: r[0])
+        self.node_ids = np.array([r[0] for r in self.rows], dtype=np.int64)
+        self.x = np.array([r[2] for r in self.rows], dtype=np.float64)
+        self.y = np.array([r[3] for r in self.rows], dtype=np.float64)
+        self.floor_ids = np.array([r[5] for r in self.rows], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def nbytes(self):
+        size = self.node_ids.nbytes + self.x.nbytes + self.y.nbytes + self.floor_ids.nbytes
+        size += sys.getsizeof(self.rows)
+        for row in self.rows:
+            size += sys.getsizeof(row) + sys.getsizeof(row[1]) + sys.getsizeof(row[4])
+        return size
+
+    def get(self, node_id):
+        i = int(np.searchsorted(self.node_ids, node_id))
+        if i < len(self.rows) and self.rows[i][0] == node_id:
+            return self.rows[i]
+        return None
+
+    def details(self, node_id):
+        """The ``path_details`` entry for ``node_id`` or None if unknown."""
+        row = self.get(node_id)
+        if row is None:
+            return None
+        return node_details(row)
+
+
+class NodeIndex:
+    """k-d tree over the ``(x_coordinate, y_coordinate)`` of a NodeTable.
+
+    Distances are in map coordinates, before the floor scale is applied.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.tree = KDTree(np.column_stack([table.x, table.y]))
+
+    def __len__(self):
+        return len(self.table)
+
+    @property
+    def nbytes(self):
+        return self.tree.nbytes
+
+    def nearest(self, x, y, k=1):
+        """Up to ``k`` ``(distance, row)`` pairs, nearest first."""
+        distances, indices = self.tree.query((x, y), k)
+        return [(d, self.table.rows[i]) for d, i in zip(distances.tolist(), indices.tolist())]
+
+    def snap(self, x, y, graph):
+        """Nearest ``(distance, row)`` whose node is in ``graph``, or None.
+
+        Nodes without edges are skipped, so the search widens until it
+        reaches one the router can start from.
+        """
+        k = 1
+        while True:
+            for distance, row in self.nearest(x, y, k):
+                if row[0] in graph:
+                    return distance, row
+            if k >= len(self):
+                return None
+            k *= 4
+
+
+def node_details(row):
+    return {
+        "node_id": row[0],
+        "name": row[1],
+        "x_coordinate": row[2],
+        "y_coordinate": row[3],
+        "node_type": row[4],
+        "floor_id": row[5]
+    }
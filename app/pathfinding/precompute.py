@@ -0,0 +1,70 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, has_app_context
+from app.pathfinding.cache import graph_cache
+from app.pathfinding.csr import CSRGraph
+from app.pathfinding.contraction import ContractionHierarchy
+
+# Background construction of contraction hierarchies after graph edits
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='graph-precompute')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def hierarchy_key(key):
+    return ('hierarchy',) + tuple(key)
+
+
+def get_hierarchy(key):
+    """Cached hierarchy for a graph scope, or None while it is (re)built."""
+    return graph_cache.get(hierarchy_key(key))
+
+
+def build_hierarchy(key):
+    """Compile the graph for ``key`` and store a hierarchy valid for that version."""
+    from app.pathfinding.build_graph import build_graph, build_building_graph  # Import here to avoid circular imports
+
+    scope, scope_id = key
+    graph = build_graph(scope_id) if scope == 'floor' else build_building_graph(scope_id)
+    depends_on = graph_cache.dependencies(key)
+    if depends_on is None:
+        return None  # Invalidated while compiling
+
+    if not isinstance(graph, CSRGraph):
+        graph = CSRGraph.from_adjacency(graph)
+    hierarchy = ContractionHierarchy(graph)
+    target = hierarchy_key(key)
+    graph_cache.put(target, hierarchy, graph_cache.version(target), depends_on)
+    return hierarchy
+
+
+def schedule_hierarchy(*keys):
+    """Queue hierarchy builds for graph scopes such as ``('floor', 3)``.
+
+    Does nothing outside an application context or when PRECOMPUTE_HIERARCHIES
+    is off. A scope already waiting in the queue is not queued twice.
+    """
+    if not has_app_context() or not current_app.config.get('PRECOMPUTE_HIERARCHIES', True):
+        return
+    app = current_app._get_current_object()
+    for key in keys:
+        key = tuple(key)
+        with _pending_lock:
+            if key in _pending:
+                continue
+            _pending.add(key)
+        _executor.submit(_run, app, key)
+
+
+def _run(app, key):
+    with _pending_lock:
+        _pending.discard(key)
+    with app.app_context():
+        try:
+            build_hierarchy(key)
+        except Exception:
+            logger.exception("Failed to precompute hierarchy for %s", key)
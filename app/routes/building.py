@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from app import db
 from app.models import Building, Floor
 from app.utils import token_required
+from app.pathfinding import invalidate_building
 
 building_bp = Blueprint("building", __name__)
 
@@ -93,6 +94,7 @@ def delete_building(current_user, building_id):
 
     db.session.delete(building)
     db.session.commit()
+    invalidate_building(building_id)
 
     return jsonify({"message": "Building deleted successfully"}), 200
 
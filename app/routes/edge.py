@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from app import db
 from app.models import Edge
 from app.utils import token_required
+from app.pathfinding import invalidate_floor, set_edge_walkable
 
 edge_bp = Blueprint("edge", __name__)
 
@@ -21,6 +22,7 @@ def create_edge(current_user):
     
     db.session.add(new_edge)
     db.session.commit()
+    invalidate_floor(new_edge.floor_id)
     return jsonify({
         "message": "Edge created successfully",
         "edge": {
@@ -55,7 +57,10 @@ def update_edge(current_user, edge_id):
     if not edge:
         return jsonify({"error": "Edge not found"}), 404
 
+    previous_floor_id = edge.floor_id
     data = request.get_json()
+    if 'is_walkable' in data and not isinstance(data['is_walkable'], bool):
+        return {"error": "is_walkable must be true or false"}, 400
     if 'start_node_id' in data:
         edge.start_node_id = data['start_node_id']
     if 'end_node_id' in data:
@@ -64,8 +69,11 @@ def update_edge(current_user, edge_id):
         edge.distance = data['distance']
     if 'floor_id' in data:
         edge.floor_id = data['floor_id']
+    if 'is_walkable' in data:
+        edge.is_walkable = data['is_walkable']
 
     db.session.commit()
+    invalidate_floor(previous_floor_id, edge.floor_id)
 
     return jsonify({
         "message": "Edge updated successfully",
@@ -86,7 +94,35 @@ def delete_edge(current_user, edge_id):
     if not edge:
         return jsonify({"error": "Edge not found"}), 404
 
+    floor_id = edge.floor_id
     db.session.delete(edge)
     db.session.commit()
+    invalidate_floor(floor_id)
 
-    return jsonify({"message": "Edge deleted successfully"}), 200
\ No newline at end of file
+    return jsonify({"message": "Edge deleted successfully"}), 200
+
+@edge_bp.route("/<int:edge_id>/walkable", methods=["PUT"])
+@token_required
+def set_edge_walkability(current_user, edge_id):
+    edge = Edge.query.get(edge_id)
+    if not edge:
+        return jsonify({"error": "Edge not found"}), 404
+
+    data = request.get_json()
+    if not data or not isinstance(data.get('is_walkable'), bool):
+        return {"error": "is_walkable must be true or false"}, 400
+
+    edge.is_walkable = data['is_walkable']
+    db.session.commit()
+
+    # Patch cached graphs in place instead of rebuilding the whole floor
+    set_edge_walkable(edge.floor_id, edge.edge_id, edge.is_walkable)
+
+    return jsonify({
+        "message": "Edge walkability updated successfully",
+        "edge": {
+            "edge_id": edge.edge_id,
+            "floor_id": edge.floor_id,
+            "is_walkable": edge.is_walkable
+        }
+    }), 200
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from app import db
 from app.models import Floor
 from app.utils import token_required
+from app.pathfinding import invalidate_floor, invalidate_building, invalidate_nodes, build_spatial_index, node_details
 
 floor_bp = Blueprint("floor", __name__)
 
@@ -23,6 +24,8 @@ def create_floor(current_user):
 
     db.session.add(new_floor)
     db.session.commit()
+    invalidate_floor(new_floor.floor_id)
+    invalidate_building(new_floor.building_id)
 
     return jsonify({
         "message": "Floor created successfully",
@@ -62,6 +65,7 @@ def update_floor(current_user, floor_id):
     if not floor:
         return jsonify({"error": "Floor not found"}), 404
 
+    previous_building_id = floor.building_id
     data = request.get_json()
     if 'building_id' in data:
         floor.building_id = data['building_id']
@@ -77,6 +81,8 @@ def update_floor(current_user, floor_id):
         floor.origin_y = data['origin_y']
 
     db.session.commit()
+    invalidate_floor(floor.floor_id)
+    invalidate_building(previous_building_id, floor.building_id)
 
     return jsonify({
         "message": "Floor updated successfully",
@@ -99,8 +105,12 @@ def delete_floor(current_user, floor_id):
     if not floor:
         return jsonify({"error": "Floor not found"}), 404
 
+    building_id = floor.building_id
     db.session.delete(floor)
     db.session.commit()
+    invalidate_floor(floor_id)
+    invalidate_nodes(floor_id)
+    invalidate_building(building_id)
 
     return jsonify({"message": "Floor deleted successfully"}), 200
 
@@ -152,6 +162,24 @@ def get_floor_edges(floor_id):
     else:
         return jsonify({"message": "No edges found for this floor"}), 404
 
+@floor_bp.route("/<int:floor_id>/nearest", methods=["GET"])
+def get_nearest_nodes(floor_id):
+    try:
+        x = float(request.args['x'])
+        y = float(request.args['y'])
+        k = int(request.args.get('k', 1))
+    except (KeyError, ValueError):
+        return jsonify({"error": "x and y are required numbers, k must be an integer"}), 400
+    if k < 1:
+        return jsonify({"error": "k must be at least 1"}), 400
+
+    index = build_spatial_index(floor_id)
+    if not len(index) and not Floor.query.get(floor_id):
+        return jsonify({"error": "Floor not found"}), 404
+
+    nodes_list = [dict(node_details(row), distance=distance) for distance, row in index.nearest(x, y, k)]
+    return jsonify({"nodes": nodes_list, "count": len(nodes_list)}), 200
+
 @floor_bp.route("/<int:floor_id>/graph", methods=["GET"])
 def get_floor_graph(floor_id):
     floor = Floor.query.get(floor_id)
@@ -1,42 +1,42 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app, url_for
 from app import db
-from app.models import Mg_Fingerprint, Mg_Raw_Reading, Mg_session
-from app.ml import windowed_statistics, KNNModel
-import numpy as np
+from app.ml import windowed_statistics, readings_to_array, decode_readings, get_model, append_fingerprints, invalidate_fingerprints, prediction_log
 from collections import Counter
 from app.utils import token_required
 
 main_bp = Blueprint("main", __name__)
 
-# Global variable to cache the trained model
-cached_knn = None
-
-def get_trained_model():
-    global cached_knn
-    if cached_knn is not None:
-        return cached_knn
-
-    # Load fingerprints from DB
-    fingerprints = Mg_Fingerprint.query.all()
-    if not fingerprints:
-        return None
-
-    X_train = []
-    y_train = []
-    for fp in fingerprints:
-        features = [fp.mean_x, fp.mean_y, fp.mean_z, fp.std_x, fp.std_y, fp.std_z]
-        X_train.append(features)
-        y_train.append(fp.node_id)
-    
-    X_train = np.array(X_train)
-    y_train = np.array(y_train)
- 
-    # Train KNN model
-    knn = KNNModel(k=3)
-    knn.fit(X_train, y_train)
-    
-    cached_knn = knn
-    return cached_knn
+def get_trained_model(scope=('all',)):
+    """Cached KNN model for a partition, see app.ml.registry."""
+    return get_model(scope)
+
+# Content types of binary readings uploads, see app.ml.decode_readings
+BINARY_READINGS = {'application/octet-stream': 'float32', 'application/x-npy': 'npy'}
+
+def read_readings():
+    """``(params, readings)`` of a readings upload; raises ValueError with the client message.
+
+    JSON bodies carry ``readings`` as ``{mag_x, mag_y, mag_z}`` objects next
+    to the other parameters. Binary bodies hold only the readings, which
+    are decoded in place, and the other parameters come from the query
+    string.
+    """
+    if request.mimetype in BINARY_READINGS:
+        readings = decode_readings(request.get_data(cache=False), BINARY_READINGS[request.mimetype])
+        if not len(readings):
+            raise ValueError("Readings must be a non-empty list")
+        return request.args.to_dict(), readings
+
+    data = request.get_json(silent=True)
+    if not data or 'readings' not in data:
+        raise ValueError("Readings data is required")
+    readings = data['readings']
+    if not isinstance(readings, list) or len(readings) == 0:
+        raise ValueError("Readings must be a non-empty list")
+    try:
+        return data, readings_to_array(readings)
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Each reading needs numeric mag_x, mag_y and mag_z")
 
 
 @main_bp.route("/", methods=["GET"])
@@ -51,92 +51,114 @@ def index():
 @main_bp.route("/fingerprint", methods=["POST"])
 # @token_required
 def create_fingerprint():
-	global cached_knn
-	data = request.get_json()
-	if not data or 'readings' not in data or 'node_id' not in data:
+	try:
+		data, readings_matrix = read_readings()
+	except ValueError as e:
+		return {"error": str(e)}, 400
+	if 'node_id' not in data:
 		return {"error": "Readings data and node_id are required"}, 400
+	try:
+		node_id = int(data['node_id'])
+	except (TypeError, ValueError):
+		return {"error": "node_id must be an integer"}, 400
 
-	readings = data['readings']
-	if not isinstance(readings, list) or len(readings) == 0:
-		return {"error": "Readings must be a non-empty list"}, 400
-
-	# Store raw readings into Mg_Raw_Reading table
-
-	# Create a new session
-	import uuid
+	# Queued uploads only store the readings; a worker computes the fingerprints
+	queued = data.get('async', request.args.get('async', current_app.config.get('FINGERPRINT_ASYNC', False)))
+	if str(queued).lower() in ('1', 'true', 'yes'):
+		from app.ml.jobs import queue_fingerprints
+		try:
+			job = queue_fingerprints(
+				node_id,
+				readings_matrix,
+				window_size=10,
+				stride=current_app.config.get('FINGERPRINT_WINDOW_STRIDE'),
+				storage=current_app.config.get('RAW_READINGS_STORAGE', 'blob'),
+			)
+		except ValueError as e:
+			return {"error": str(e)}, 400
+		status_url = url_for('main.get_fingerprint_job', job_id=job.job_id)
+		return jsonify({"message": "Fingerprint job queued", "job_id": job.job_id, "session_id": job.session_id, "status_url": status_url}), 202, {"Location": status_url}
 
-	session = Mg_session(
-		session_id=str(uuid.uuid4()),
-		node_id=data.get('node_id', 0),
-	)
-	db.session.add(session)
-	db.session.commit()
-
-	for reading in readings:
-		mg_reading = Mg_Raw_Reading(
-			session_id=session.session_id,
-			mag_x=reading['mag_x'],
-			mag_y=reading['mag_y'],
-			mag_z=reading['mag_z']
+	# Session, raw readings and fingerprints are stored in one transaction
+	from app.ml.ingest import ingest_session
+	try:
+		session_id, fingerprint_ids, windowed_readings = ingest_session(
+			node_id,
+			readings_matrix,
+			window_size=10,
+			stride=current_app.config.get('FINGERPRINT_WINDOW_STRIDE'),
+			storage=current_app.config.get('RAW_READINGS_STORAGE', 'blob'),
 		)
-		db.session.add(mg_reading)
+	except ValueError as e:
+		return {"error": str(e)}, 400
 
-	db.session.commit()
+	# Append the new windows to the cached models covering this node's floor
+	from app.models import Node
+	node = Node.query.get(node_id)
+	if node:
+		append_fingerprints(node.floor_id, fingerprint_ids, windowed_readings, [node.node_id] * len(fingerprint_ids))
+	else:
+		invalidate_fingerprints(None)
+
+	return jsonify({"message": "Fingerprint created successfully", "session_id": session_id, "fingerprints": len(fingerprint_ids)}), 201
 
-	# Convert readings to a format suitable for windowed_statistics (list of lists)
-	readings_matrix = [[r['mag_x'], r['mag_y'], r['mag_z']] for r in readings]
-	windowed_readings = windowed_statistics(readings_matrix, window_size=10)
-	if windowed_readings.size == 0:
-		return {"error": "Not enough data to form a complete window"}, 400
-	for win in windowed_readings:
-		fingerprint = Mg_Fingerprint(
-			node_id=data['node_id'],
-			mean_x=float(win[0]),
-			mean_y=float(win[1]),
-			mean_z=float(win[2]),
-			std_x=float(win[3]),
-			std_y=float(win[4]),
-			std_z=float(win[5]),
-			sample_count=10
-		)
-		db.session.add(fingerprint)
-	db.session.commit()
 
-	# Invalidate the cache since we added new data
-	cached_knn = None
+@main_bp.route("/fingerprint/jobs/<job_id>", methods=["GET"])
+def get_fingerprint_job(job_id):
+	from app.ml.jobs import job_details
+	from app.models import Fingerprint_job
 
-	return jsonify({"message": "Fingerprint created successfully"}), 201
+	job = db.session.get(Fingerprint_job, job_id)
+	if not job:
+		return {"error": "Job not found"}, 404
+	return jsonify(job_details(job)), 200
 
 
 @main_bp.route("/localize", methods=["POST"])
 def localize():
-	data = request.get_json()
-	if not data or 'readings' not in data:
-		return {"error": "Readings data is required"}, 400
-	readings = data['readings']
-
-	if not isinstance(readings, list) or len(readings) == 0:
-		return {"error": "Readings must be a non-empty list"}, 400
-
-	# Convert readings to a format suitable for windowed_statistics (list of lists)
-	readings_matrix = [[r['mag_x'], r['mag_y'], r['mag_z']] for r in readings]
-	windowed_readings = windowed_statistics(readings_matrix, window_size=3)
+	# JSON readings are converted to an (n, 3) float array, binary ones decoded in place
+	try:
+		data, readings_matrix = read_readings()
+	except ValueError as e:
+		return {"error": str(e)}, 400
+	windowed_readings = windowed_statistics(readings_matrix, window_size=3, stride=current_app.config.get('LOCALIZE_WINDOW_STRIDE'))
 	if windowed_readings.size == 0:
 		return {"error": "Not enough data to form a complete window"}, 400
 
+	# A floor or building hint narrows the search to that venue's fingerprints
+	try:
+		if data.get('floor_id') is not None:
+			scope = ('floor', int(data['floor_id']))
+		elif data.get('building_id') is not None:
+			scope = ('building', int(data['building_id']))
+		else:
+			scope = ('all',)
+	except (TypeError, ValueError):
+		return {"error": "floor_id and building_id must be integers"}, 400
+	try:
+		actual_node_id = int(data['actual_node_id']) if data.get('actual_node_id') is not None else None
+	except (TypeError, ValueError):
+		return {"error": "actual_node_id must be an integer"}, 400
+
+	from app.models import Node
+
+	if actual_node_id is not None and not Node.query.get(actual_node_id):
+		return {"error": "actual_node_id not found"}, 400
+
 	# Get trained model (cached if available)
-	knn = get_trained_model()
+	knn = get_trained_model(scope)
 	if knn is None:
 		return {"error": "No fingerprints available for localization"}, 400
 	predictions = knn.predict(windowed_readings)
 	predicted_node = int(Counter(predictions).most_common(1)[0][0])
  
-	from app.models import Node
- 
 	node = Node.query.get(predicted_node)
 	if not node:
 		return {"error": "Predicted node not found in database"}, 400
 
+	# Queued for the background writer; a surveyor can pass the true node to score the model
+	prediction_log.record(getattr(knn, 'model_id', None), node.node_id, actual_node_id)
+
 	return jsonify({
 		"predicted_node_id": node.node_id,
 		"name": node.name,
@@ -146,34 +168,226 @@ def localize():
 		"node_type": node.node_type
 	}), 200
  
+@main_bp.route("/localize/sessions", methods=["POST"])
+def create_localization_session():
+	data = request.get_json()
+	if not data or ('floor_id' not in data and 'building_id' not in data):
+		return {"error": "floor_id or building_id is required"}, 400
+
+	from app.ml import TrackingSession, session_store
+	from app.pathfinding import build_graph, build_building_graph
+
+	try:
+		scope = ('floor', int(data['floor_id'])) if 'floor_id' in data else ('building', int(data['building_id']))
+	except (TypeError, ValueError):
+		return {"error": "floor_id and building_id must be integers"}, 400
+	try:
+		build_graph(scope[1]) if scope[0] == 'floor' else build_building_graph(scope[1])
+	except ValueError as e:
+		return {"error": str(e)}, 404
+
+	session = session_store.add(TrackingSession(
+		scope,
+		window_size=3,
+		stride=current_app.config.get('LOCALIZE_WINDOW_STRIDE'),
+		stay_probability=current_app.config.get('LOCALIZE_STAY_PROBABILITY', 0.6),
+	))
+	return jsonify({"session_id": session.session_id, f"{scope[0]}_id": scope[1]}), 201
+
+
+@main_bp.route("/localize/sessions/<session_id>/readings", methods=["POST"])
+def update_localization_session(session_id):
+	try:
+		data, readings = read_readings()
+	except ValueError as e:
+		return {"error": str(e)}, 400
+
+	from app.ml import session_store
+	from app.models import Node
+	from app.pathfinding import CSRGraph, build_graph, build_building_graph, build_node_table
+
+	try:
+		actual_node_id = int(data['actual_node_id']) if data.get('actual_node_id') is not None else None
+	except (TypeError, ValueError):
+		return {"error": "actual_node_id must be an integer"}, 400
+	if actual_node_id is not None and not Node.query.get(actual_node_id):
+		return {"error": "actual_node_id not found"}, 400
+
+	session = session_store.get(session_id)
+	if session is None:
+		return {"error": "Session not found or expired"}, 404
+
+	scope = session.scope
+	knn = get_trained_model(scope)
+	if knn is None:
+		return {"error": "No fingerprints available for localization"}, 400
+	graph = build_graph(scope[1]) if scope[0] == 'floor' else build_building_graph(scope[1])
+	if not isinstance(graph, CSRGraph):
+		graph = CSRGraph.from_adjacency(graph)
+	nodes = build_node_table(scope)
+
+	with session.lock:
+		processed = session.update(readings, knn, graph, nodes.node_ids)
+		estimate = session.estimate()
+
+	response = {"session_id": session_id, "windows_processed": processed, "total_windows": session.windows}
+	if estimate is not None:
+		prediction_log.record(getattr(knn, 'model_id', None), estimate[0], actual_node_id)
+		response["node"] = nodes.details(estimate[0])
+		response["probability"] = estimate[1]
+	return jsonify(response), 200
+
+
+@main_bp.route("/localize/sessions/<session_id>", methods=["DELETE"])
+def delete_localization_session(session_id):
+	from app.ml import session_store
+
+	if session_store.remove(session_id) is None:
+		return {"error": "Session not found or expired"}, 404
+	return jsonify({"message": "Session closed"}), 200
+
+
+@main_bp.route("/localize/accuracy", methods=["GET"])
+def localization_accuracy():
+	from datetime import datetime
+	from app.ml import accuracy_rollup
+
+	model_id = request.args.get('model_id', type=int)
+	since = request.args.get('since')
+	if since is not None:
+		try:
+			since = datetime.fromisoformat(since)
+		except ValueError:
+			return {"error": "since must be an ISO 8601 timestamp"}, 400
+
+	return jsonify({"models": accuracy_rollup(model_id, since), "buffer": prediction_log.stats()}), 200
+
+
 @main_bp.route("/path", methods=["GET"])
 def get_path():
 	data = request.get_json()
-	if not data or 'start_node_id' not in data or 'end_node_id' not in data or 'floor_id' not in data:
-		return {"error": "start_node_id, end_node_id, and floor_id are required"}, 400
+	if not data or ('start_node_id' not in data and 'start' not in data) or ('end_node_id' not in data and 'end' not in data) or ('floor_id' not in data and 'building_id' not in data):
+		return {"error": "start_node_id or start, end_node_id or end, and floor_id or building_id are required"}, 400
 
-	from app.pathfinding import findpath, build_graph
+	from app.pathfinding import findpath, build_graph, build_building_graph, build_node_table, build_spatial_index, node_details, get_hierarchy, schedule_hierarchy, ALGORITHMS
 	from app.models import Node
+
+	algorithm = data.get('algorithm', 'ch')
+	if algorithm not in ALGORITHMS:
+		return {"error": f"algorithm must be one of: {', '.join(ALGORITHMS)}"}, 400
  
-	graph = build_graph(data['floor_id'])
-	distance, path = findpath(data['start_node_id'], data['end_node_id'], graph)
+	# A building_id routes across floors through stairs and elevators
+	try:
+		key = ('building', int(data['building_id'])) if 'building_id' in data else ('floor', int(data['floor_id']))
+	except (TypeError, ValueError):
+		return {"error": "floor_id and building_id must be integers"}, 400
+	try:
+		graph = build_building_graph(key[1]) if key[0] == 'building' else build_graph(key[1])
+	except ValueError as e:
+		return {"error": str(e)}, 404
+
+	# Raw coordinates are snapped to the nearest node the graph can route from
+	endpoints = {}
+	snapped = {}
+	for side in ('start', 'end'):
+		if f'{side}_node_id' in data:
+			endpoints[side] = data[f'{side}_node_id']
+			continue
+		point = data[side]
+		try:
+			x, y = float(point['x']), float(point['y'])
+			floor_id = int(point['floor_id']) if 'floor_id' in point else (key[1] if key[0] == 'floor' else None)
+		except (TypeError, KeyError, ValueError):
+			return {"error": f"{side} must be an object with numeric x and y"}, 400
+		if floor_id is None:
+			return {"error": f"{side}.floor_id is required when routing with building_id"}, 400
+		match = build_spatial_index(floor_id).snap(x, y, graph)
+		if match is None:
+			return {"error": f"No routable node found near {side}"}, 400
+		endpoints[side] = match[1][0]
+		snapped[side] = {"node_id": match[1][0], "distance": match[0]}
+
+	# Use the precomputed hierarchy when ready, otherwise search and queue a build
+	if algorithm == 'ch':
+		hierarchy = get_hierarchy(key)
+		if hierarchy is not None:
+			graph = hierarchy
+		else:
+			schedule_hierarchy(key)
+	stats = {}
+	distance, path = findpath(endpoints['start'], endpoints['end'], graph, algorithm, stats)
  
 	if distance == float('inf'):
 		return jsonify({"message": "No path found between the specified nodes"}), 404
 
-	path_details = [
-		{
-			"node_id": node_id,
-			"name": Node.query.get(node_id).name,
-			"x_coordinate": Node.query.get(node_id).x_coordinate,
-			"y_coordinate": Node.query.get(node_id).y_coordinate,
-			"node_type": Node.query.get(node_id).node_type,
-			"floor_id": Node.query.get(node_id).floor_id
-		} for node_id in path
-	]
+	# Node attributes come from the table cached with the graph; anything
+	# missing from it is fetched in one query instead of once per node
+	nodes = build_node_table(key)
+	path_details = [nodes.details(node_id) for node_id in path]
+	missing = [node_id for node_id, details in zip(path, path_details) if details is None]
+	if missing:
+		fetched = {
+			n.node_id: node_details((n.node_id, n.name, n.x_coordinate, n.y_coordinate, n.node_type, n.floor_id))
+			for n in Node.query.filter(Node.node_id.in_(missing)).all()
+		}
+		path_details = [details or fetched.get(node_id) for node_id, details in zip(path, path_details)]
  
-	return jsonify({
+	response = {
 		"total_distance": distance,
 		"path": path,
-		"path_details": path_details
-	})
\ No newline at end of file
+		"path_details": path_details,
+		"algorithm": stats['algorithm'],
+		"expanded_nodes": stats['expanded']
+	}
+	if snapped:
+		response["snapped"] = snapped
+	return jsonify(response)
+
+
+@main_bp.route("/path/matrix", methods=["POST"])
+def get_distance_matrix():
+	data = request.get_json()
+	if not data or 'sources' not in data or 'targets' not in data or ('floor_id' not in data and 'building_id' not in data):
+		return {"error": "sources, targets, and floor_id or building_id are required"}, 400
+
+	sources, targets = data['sources'], data['targets']
+	if not isinstance(sources, list) or not isinstance(targets, list) or not sources or not targets:
+		return {"error": "sources and targets must be non-empty lists of node ids"}, 400
+	if any(isinstance(node_id, bool) or not isinstance(node_id, int) for node_id in sources + targets):
+		return {"error": "sources and targets must be non-empty lists of node ids"}, 400
+
+	if len(sources) * len(targets) > current_app.config['DISTANCE_MATRIX_MAX_CELLS']:
+		return {"error": "Too many source/target pairs requested"}, 400
+
+	from app.pathfinding import build_graph, build_building_graph, distance_matrix
+
+	try:
+		key = ('building', int(data['building_id'])) if 'building_id' in data else ('floor', int(data['floor_id']))
+	except (TypeError, ValueError):
+		return {"error": "floor_id and building_id must be integers"}, 400
+	try:
+		graph = build_building_graph(key[1]) if key[0] == 'building' else build_graph(key[1])
+	except ValueError as e:
+		return {"error": str(e)}, 404
+
+	workers = 1
+	if len(sources) >= current_app.config['DISTANCE_MATRIX_PARALLEL_MIN']:
+		workers = current_app.config['DISTANCE_MATRIX_WORKERS']
+
+	distances, paths = distance_matrix(graph, sources, targets, bool(data.get('include_paths')), workers)
+
+	response = {
+		"sources": sources,
+		"targets": targets,
+		"distances": distances
+	}
+	if paths is not None:
+		response["paths"] = paths
+	return jsonify(response), 200
+
+@main_bp.route("/path/cache", methods=["GET"])
+def get_path_cache_stats():
+	"""Hit/miss counters for the compiled graph cache of this worker."""
+	from app.pathfinding import graph_cache
+
+	return jsonify(graph_cache.stats()), 200
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from app import db
 from app.models import Node
 from app.utils import token_required
+from app.pathfinding import invalidate_floor, invalidate_nodes
 
 node_bp = Blueprint("node", __name__)
 
@@ -22,6 +23,7 @@ def create_node(current_user):
     
     db.session.add(new_node)
     db.session.commit()
+    invalidate_floor(new_node.floor_id)
     
     return jsonify({
         "message": "Node created successfully",
@@ -59,6 +61,7 @@ def update_node(current_user, node_id):
     if not node:
         return jsonify({"error": "Node not found"}), 404
 
+    previous_floor_id = node.floor_id
     data = request.get_json()
     if 'name' in data:
         node.name = data['name']
@@ -72,6 +75,9 @@ def update_node(current_user, node_id):
         node.node_type = data['node_type']
 
     db.session.commit()
+    invalidate_floor(previous_floor_id, node.floor_id)
+    if node.floor_id != previous_floor_id:
+        invalidate_nodes(previous_floor_id, node.floor_id)
 
     return jsonify({
         "message": "Node updated successfully",
@@ -93,8 +99,11 @@ def delete_node(current_user, node_id):
     if not node:
         return jsonify({"error": "Node not found"}), 404
 
+    floor_id = node.floor_id
     db.session.delete(node)
     db.session.commit()
+    invalidate_floor(floor_id)
+    invalidate_nodes(floor_id)
 
     return jsonify({"message": "Node deleted successfully"}), 200
 
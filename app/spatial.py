@@ -0,0 +1,127 @@
+import heapq
+import numpy as np
+
+# Exact k-nearest-neighbour search over small, static point sets
+
+
+class KDTree:
+    """Array-backed k-d tree with bounding boxes per node.
+
+    Results are exact and ordered by ``(distance, index)``, the same order a
+    stable sort over brute-force distances gives, so ties are broken by the
+    lower point index. Distances are computed exactly as
+    ``sqrt(sum((p - x) ** 2))`` on the original points.
+    """
+
+    # Arrays that, with the points, fully describe a built tree
+    ARRAYS = ('order', 'lower', 'upper', 'start', 'end', 'left', 'right', 'split_dim', 'split_value', 'sorted_points')
+
+    def __init__(self, points, leaf_size=16, arrays=None):
+        self.points = np.asarray(points)
+        # Slack for rounding when comparing box bounds with exact distances
+        self.epsilon = 8 * np.finfo(self.points.dtype if self.points.dtype.kind == 'f' else np.float64).eps
+        self.leaf_size = max(int(leaf_size), 1)
+        if arrays is not None:
+            # Reuse a saved tree, e.g. memory-mapped from a model artifact
+            for name in self.ARRAYS:
+                setattr(self, name, arrays[name])
+            return
+        n, dims = self.points.shape if self.points.ndim == 2 else (0, 0)
+
+        self.order = np.arange(n)
+        lower, upper, start, end, left, right, split_dim, split_value = [], [], [], [], [], [], [], []
+
+        def add(lo, hi):
+            block = self.points[self.order[lo:hi]]
+            lower.append(block.min(axis=0) if hi > lo else np.zeros(dims))
+            upper.append(block.max(axis=0) if hi > lo else np.zeros(dims))
+            start.append(lo)
+            end.append(hi)
+            left.append(-1)
+            right.append(-1)
+            split_dim.append(-1)
+            split_value.append(0.0)
+            return len(start) - 1
+
+        stack = [add(0, n)]
+        while stack:
+            node = stack.pop()
+            lo, hi = start[node], end[node]
+            if hi - lo <= self.leaf_size:
+                continue
+            spread = upper[node] - lower[node]
+            dim = int(np.argmax(spread))
+            if spread[dim] == 0:
+                continue  # All points coincide
+
+            # Median split along the widest dimension
+            mid = (lo + hi) // 2
+            segment = self.order[lo:hi]
+            part = np.argpartition(self.points[segment, dim], mid - lo)
+            self.order[lo:hi] = segment[part]
+
+            split_dim[node] = dim
+            split_value[node] = float(self.points[self.order[mid], dim])
+            left[node] = add(lo, mid)
+            right[node] = add(mid, hi)
+            stack.extend((left[node], right[node]))
+
+        self.lower = np.array(lower).reshape(-1, dims)
+        self.upper = np.array(upper).reshape(-1, dims)
+        self.start = np.array(start, dtype=np.int64)
+        self.end = np.array(end, dtype=np.int64)
+        self.left = np.array(left, dtype=np.int64)
+        self.right = np.array(right, dtype=np.int64)
+        self.split_dim = np.array(split_dim, dtype=np.int64)
+        self.split_value = np.array(split_value, dtype=np.float64)
+        # Leaf blocks laid out contiguously so each leaf is one slice
+        self.sorted_points = self.points[self.order]
+
+    def __len__(self):
+        return len(self.order)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.arrays().values())
+
+    def arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    def query(self, point, k=1):
+        """``(distances, indices)`` of the ``k`` points nearest to ``point``."""
+        point = np.asarray(point, dtype=self.points.dtype)
+        k = min(int(k), len(self))
+        if k <= 0:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+
+        best = []  # max-heap of (-distance, -index)
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if len(best) == k:
+                gap = np.maximum(self.lower[node] - point, 0) + np.maximum(point - self.upper[node], 0)
+                bound = np.sqrt(np.sum(gap ** 2))
+                if bound > -best[0][0] * (1 + self.epsilon) + self.epsilon:
+                    continue
+
+            if self.left[node] == -1:
+                lo, hi = self.start[node], self.end[node]
+                distances = np.sqrt(np.sum((self.sorted_points[lo:hi] - point) ** 2, axis=1))
+                for distance, index in zip(distances.tolist(), self.order[lo:hi].tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, -index))
+                    elif (distance, index) < (-best[0][0], -best[0][1]):
+                        heapq.heapreplace(best, (-distance, -index))
+                continue
+
+            # Visit the nearer child first: push it last
+            if point[self.split_dim[node]] <= self.split_value[node]:
+                stack.extend((self.right[node], self.left[node]))
+            else:
+                stack.extend((self.left[node], self.right[node]))
+
+        best = sorted((-d, -i) for d, i in best)
+        return (
+            np.array([d for d, _ in best], dtype=np.float64),
+            np.array([i for _, i in best], dtype=np.int64),
+        )
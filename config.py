@@ -9,4 +9,68 @@ class Config:
     # Default to SQLite for local dev, easy to switch to Postgres later
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///app.db'
     if SQLALCHEMY_DATABASE_URI.startswith("postgres://"):
-        SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace("postgres://", "postgresql://", 1)
\ No newline at end of file
+        SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace("postgres://", "postgresql://", 1)
+
+    # Memory budget for compiled floor graphs kept in each worker
+    GRAPH_CACHE_MAX_BYTES = int(os.environ.get('GRAPH_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+    # Memory budget of the localization model cache, separate from the graphs; larger models are refitted per request
+    MODEL_CACHE_MAX_BYTES = int(os.environ.get('MODEL_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+    # Seconds between checks for graph invalidations published by other workers (0: every request)
+    GRAPH_CACHE_SYNC_INTERVAL = float(os.environ.get('GRAPH_CACHE_SYNC_INTERVAL', 1.0))
+
+    # Compiled graph layout: 'csr' (NumPy arrays) or 'dict' (adjacency lists)
+    GRAPH_REPRESENTATION = os.environ.get('GRAPH_REPRESENTATION', 'csr')
+
+    # Cost of moving one floor through a connector node, keyed by node_type
+    CONNECTOR_COSTS = {'stairs': 15.0, 'elevator': 10.0}
+
+    # Build contraction hierarchies in the background after graph edits
+    PRECOMPUTE_HIERARCHIES = os.environ.get('PRECOMPUTE_HIERARCHIES', 'true').lower() == 'true'
+
+    # Distance matrix limits; rows run on a process pool above PARALLEL_MIN sources
+    DISTANCE_MATRIX_MAX_CELLS = int(os.environ.get('DISTANCE_MATRIX_MAX_CELLS', 250000))
+    DISTANCE_MATRIX_WORKERS = int(os.environ.get('DISTANCE_MATRIX_WORKERS', min(4, os.cpu_count() or 1)))
+    DISTANCE_MATRIX_PARALLEL_MIN = int(os.environ.get('DISTANCE_MATRIX_PARALLEL_MIN', 16))
+
+    # Fingerprint search: 'brute', 'kdtree', or 'auto' (k-d tree from KNN_TREE_MIN_ROWS rows)
+    KNN_SEARCH = os.environ.get('KNN_SEARCH', 'auto')
+    KNN_TREE_MIN_ROWS = int(os.environ.get('KNN_TREE_MIN_ROWS', 5000))
+
+    # Samples between window starts; below the window size (10 and 3) windows overlap
+    FINGERPRINT_WINDOW_STRIDE = int(os.environ.get('FINGERPRINT_WINDOW_STRIDE', 10))
+    LOCALIZE_WINDOW_STRIDE = int(os.environ.get('LOCALIZE_WINDOW_STRIDE', 3))
+
+    # Rows appended to a cached localization model before its k-d tree is rebuilt in the background
+    KNN_REBUILD_PENDING = int(os.environ.get('KNN_REBUILD_PENDING', 1000))
+
+    # Directory of model artifacts written by `flask ml build`, mapped at startup
+    ML_ARTIFACT_DIR = os.environ.get('ML_ARTIFACT_DIR', 'artifacts')
+    ML_LOAD_ARTIFACT = os.environ.get('ML_LOAD_ARTIFACT', 'true').lower() == 'true'
+
+    # KNN options: standardize features, 'uniform' or 'distance' voting, float64 or float32 storage
+    KNN_STANDARDIZE = os.environ.get('KNN_STANDARDIZE', 'false').lower() == 'true'
+    KNN_WEIGHTS = os.environ.get('KNN_WEIGHTS', 'uniform')
+    KNN_DTYPE = os.environ.get('KNN_DTYPE', 'float64')
+
+    # Streaming localization sessions: idle timeout (seconds), cap, and HMM chance of staying on a node per window
+    LOCALIZE_SESSION_TTL = int(os.environ.get('LOCALIZE_SESSION_TTL', 300))
+    LOCALIZE_MAX_SESSIONS = int(os.environ.get('LOCALIZE_MAX_SESSIONS', 10000))
+    LOCALIZE_STAY_PROBABILITY = float(os.environ.get('LOCALIZE_STAY_PROBABILITY', 0.6))
+
+    # Localization_log writer: buffered entries (sampled once 3/4 full), rows per insert, seconds between flushes
+    LOCALIZATION_LOG_ENABLED = os.environ.get('LOCALIZATION_LOG_ENABLED', 'true').lower() == 'true'
+    LOCALIZATION_LOG_BUFFER = int(os.environ.get('LOCALIZATION_LOG_BUFFER', 10000))
+    LOCALIZATION_LOG_BATCH = int(os.environ.get('LOCALIZATION_LOG_BATCH', 500))
+    LOCALIZATION_LOG_FLUSH_INTERVAL = float(os.environ.get('LOCALIZATION_LOG_FLUSH_INTERVAL', 1.0))
+
+    # Raw survey readings: 'blob' packs each session into one compressed Mg_session column, 'rows' writes Mg_Raw_Reading rows
+    RAW_READINGS_STORAGE = os.environ.get('RAW_READINGS_STORAGE', 'blob')
+
+    # Fingerprint uploads: answer 202 with a job id and compute fingerprints on a pool of FINGERPRINT_WORKERS threads (0: leave jobs to `flask ml work`)
+    FINGERPRINT_ASYNC = os.environ.get('FINGERPRINT_ASYNC', 'false').lower() == 'true'
+    FINGERPRINT_WORKERS = int(os.environ.get('FINGERPRINT_WORKERS', 2))
+
+    # Seconds after which a running fingerprint job counts as abandoned and is queued again
+    FINGERPRINT_JOB_TIMEOUT = int(os.environ.get('FINGERPRINT_JOB_TIMEOUT', 600))
@@ -0,0 +1,47 @@
+import pytest
+from app import create_app, db
+from app.models import Building, Floor, Node
+from config import Config
+
+
+class TestConfig(Config):
+    TESTING = True
+    PRECOMPUTE_HIERARCHIES = False
+    ML_LOAD_ARTIFACT = False
+    LOCALIZATION_LOG_ENABLED = False
+    FINGERPRINT_WORKERS = 0
+    GRAPH_CACHE_SYNC_INTERVAL = 0
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    from app.pathfinding import graph_cache
+
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    app = create_app(TestConfig)
+    # The graph cache is shared by every app in the process
+    graph_cache.reset()
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def node(app):
+    """A node on the only floor of a new building."""
+    building = Building(name='B')
+    db.session.add(building)
+    db.session.flush()
+    floor = Floor(building_id=building.building_id, floor_number=1)
+    db.session.add(floor)
+    db.session.flush()
+    node = Node(name='N', x_coordinate=0.0, y_coordinate=0.0, node_type='room', floor_id=floor.floor_id)
+    db.session.add(node)
+    db.session.commit()
+    return node
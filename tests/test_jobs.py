@@ -0,0 +1,26 @@
+import numpy as np
+from app import db
+from app.ml import jobs
+from app.models import Fingerprint_job, Mg_Fingerprint
+
+
+def test_requeued_job_does_not_store_fingerprints_twice(node, monkeypatch):
+    job_id = jobs.queue_fingerprints(node.node_id, np.ones((20, 3))).job_id
+    session_readings = jobs.session_readings
+
+    def requeued_meanwhile(session_id):
+        # The job looks stale to another worker, which requeues and claims it again
+        jobs.requeue_stale(0)
+        assert jobs.claim_job(job_id) is not None
+        return session_readings(session_id)
+
+    monkeypatch.setattr(jobs, 'session_readings', requeued_meanwhile)
+    assert jobs.run_job(job_id) is False
+    assert db.session.query(Mg_Fingerprint).count() == 0
+    assert db.session.get(Fingerprint_job, job_id).status == 'running'
+
+    monkeypatch.undo()
+    db.session.get(Fingerprint_job, job_id).status = 'queued'
+    db.session.commit()
+    assert jobs.run_job(job_id) is True
+    assert db.session.get(Fingerprint_job, job_id).fingerprint_count == db.session.query(Mg_Fingerprint).count() == 2
@@ -0,0 +1,77 @@
+import math
+import random
+from collections import defaultdict
+import numpy as np
+import pytest
+from app.pathfinding import CSRGraph, findpath, findpath_bidirectional
+from app.pathfinding.cache import GraphCache
+
+
+def random_graph(rng):
+    """Random undirected multigraph as ``(dict graph, CSR graph, arc weights)``.
+
+    Node ids are sparse and some nodes have no edges, so queries also hit
+    unreachable and unknown endpoints.
+    """
+    node_ids = rng.sample(range(1, 500), rng.randint(1, 60))
+    edges = [
+        (rng.choice(node_ids), rng.choice(node_ids), rng.choice([1.0, 2.0, rng.uniform(0, 5)]))
+        for _ in range(rng.randint(0, 150))
+    ]
+    graph = defaultdict(list)
+    weights = {}
+    for u, v, w in edges:
+        graph[u].append((v, w))
+        graph[v].append((u, w))
+        for arc in ((u, v), (v, u)):
+            weights[arc] = min(weights.get(arc, math.inf), w)
+    csr = CSRGraph.from_edges([e[0] for e in edges], [e[1] for e in edges], [e[2] for e in edges])
+    return node_ids, graph, csr, weights
+
+
+def assert_valid_path(path, distance, start, end, weights):
+    if distance == math.inf:
+        assert path == []
+        return
+    assert path[0] == start and path[-1] == end
+    assert sum(weights[arc] for arc in zip(path, path[1:])) == pytest.approx(distance)
+
+
+@pytest.mark.parametrize('layout', ['dict', 'csr'])
+def test_bidirectional_matches_dijkstra_on_random_graphs(layout):
+    rng = random.Random(7)
+    for _ in range(300):
+        node_ids, graph, csr, weights = random_graph(rng)
+        searched = graph if layout == 'dict' else csr
+        for _ in range(10):
+            start, end = rng.choice(node_ids + [0]), rng.choice(node_ids + [0])
+            expected, _ = findpath(start, end, graph, 'dijkstra')
+            distance, path = findpath_bidirectional(start, end, searched)
+
+            if expected == math.inf:
+                assert distance == math.inf
+            else:
+                assert distance == pytest.approx(expected)
+            assert_valid_path(path, distance, start, end, weights)
+
+
+def test_bidirectional_reports_stats():
+    graph = CSRGraph.from_edges([1, 2, 3], [2, 3, 4], [1.0, 1.0, 1.0])
+    stats = {}
+    assert findpath(1, 4, graph, 'bidirectional', stats) == (3.0, [1, 2, 3, 4])
+    assert stats['algorithm'] == 'bidirectional'
+    assert stats['expanded'] > 0
+
+
+def test_cache_keeps_models_in_their_own_budget(caplog):
+    cache = GraphCache(max_bytes=10_000, budgets={'model': 100_000})
+    model = np.zeros(5_000)
+    cache.put(('model', 'all'), model, cache.version(('model', 'all')))
+    cache.put(('floor', 1), np.zeros(100), cache.version(('floor', 1)))
+    assert cache.get(('model', 'all')) is model
+    assert cache.get(('floor', 1)) is not None
+
+    cache.put(('floor', 2), np.zeros(5_000), cache.version(('floor', 2)))
+    assert cache.get(('floor', 2)) is None
+    assert 'over the 10000 byte budget' in caplog.text
+    assert cache.stats()['budgets']['model'] == {'bytes': model.nbytes, 'max_bytes': 100_000}
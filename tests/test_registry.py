@@ -0,0 +1,29 @@
+from app import db
+from app.ml.registry import append_fingerprints, get_model
+from app.models import Mg_Fingerprint
+
+
+def add_fingerprint(fingerprint_id, node_id):
+    db.session.add(Mg_Fingerprint(
+        fingerprint_id=fingerprint_id, node_id=node_id, mean_x=fingerprint_id, mean_y=0.0, mean_z=0.0,
+        std_x=1.0, std_y=1.0, std_z=1.0, sample_count=10,
+    ))
+    db.session.commit()
+    return [fingerprint_id], [[fingerprint_id, 0.0, 0.0, 1.0, 1.0, 1.0]], [node_id]
+
+
+def test_model_keeps_fingerprints_committed_out_of_id_order(node):
+    add_fingerprint(1, node.node_id)
+    scope = ('floor', node.floor_id)
+    assert get_model(scope).fingerprint_ids.tolist() == [1]
+
+    # Id 3 is committed and appended by this worker before id 2 is committed by another
+    append_fingerprints(node.floor_id, *add_fingerprint(3, node.node_id))
+    add_fingerprint(2, node.node_id)
+    model = get_model(scope)
+    assert model.fingerprint_ids.tolist() == [1, 2, 3]
+    assert len(model.X_train) == 3
+
+    # Appending rows the model already caught up on adds nothing
+    append_fingerprints(node.floor_id, [2], [[2, 0.0, 0.0, 1.0, 1.0, 1.0]], [node.node_id])
+    assert len(get_model(scope).X_train) == 3
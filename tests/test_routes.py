@@ -0,0 +1,83 @@
+from sqlalchemy import event
+from app import db
+from app.models import Building, Edge, Floor, Node
+
+
+def seed_corridor(building_id, length):
+    """Floor with ``length`` nodes in a line; returns ``(floor_id, node_ids)``."""
+    floor = Floor(building_id=building_id, floor_number=length)
+    db.session.add(floor)
+    db.session.flush()
+    nodes = [Node(name=f'N{i}', x_coordinate=i * 10.0, y_coordinate=0.0, node_type='corridor', floor_id=floor.floor_id) for i in range(length)]
+    db.session.add_all(nodes)
+    db.session.flush()
+    db.session.add_all(
+        Edge(start_node_id=a.node_id, end_node_id=b.node_id, distance=10.0, floor_id=floor.floor_id)
+        for a, b in zip(nodes, nodes[1:])
+    )
+    db.session.commit()
+    return floor.floor_id, [n.node_id for n in nodes]
+
+
+def count_queries(client, **body):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        response = client.get('/api/path', json=body)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return len(statements), response.get_json()
+
+
+def test_path_query_count_does_not_grow_with_path_length(client):
+    building = Building(name='B')
+    db.session.add(building)
+    db.session.commit()
+    short_floor, short_nodes = seed_corridor(building.building_id, 2)
+    long_floor, long_nodes = seed_corridor(building.building_id, 40)
+
+    for algorithm in ('dijkstra', 'astar'):
+        counts = []
+        for floor_id, nodes in ((short_floor, short_nodes), (long_floor, long_nodes)):
+            # First request compiles the graph, the second is served from the cache
+            for _ in range(2):
+                queries, result = count_queries(client, start_node_id=nodes[0], end_node_id=nodes[-1], floor_id=floor_id, algorithm=algorithm)
+                assert result['path'] == nodes
+                assert [d['node_id'] for d in result['path_details']] == nodes
+                counts.append(queries)
+        cold_short, warm_short, cold_long, warm_long = counts
+        assert cold_short == cold_long
+        assert warm_short == warm_long
+
+
+def test_path_rejects_bad_and_unknown_venues(client):
+    body = {'start_node_id': 1, 'end_node_id': 2}
+    assert client.get('/api/path', json={**body, 'floor_id': 'first'}).status_code == 400
+    assert client.get('/api/path', json={**body, 'building_id': None}).status_code == 400
+    assert client.get('/api/path', json={**body, 'floor_id': 999}).status_code == 404
+    response = client.get('/api/path', json={**body, 'building_id': 999})
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "Building not found"}
+
+
+def test_distance_matrix_validates_ids(client):
+    building = Building(name='B')
+    db.session.add(building)
+    db.session.commit()
+    floor_id, nodes = seed_corridor(building.building_id, 3)
+
+    for sources in ([None], ['1'], [True], [nodes[0], 1.5]):
+        response = client.post('/api/path/matrix', json={'sources': sources, 'targets': nodes, 'floor_id': floor_id})
+        assert response.status_code == 400
+    assert client.post('/api/path/matrix', json={'sources': nodes, 'targets': nodes, 'floor_id': 'x'}).status_code == 400
+    assert client.post('/api/path/matrix', json={'sources': nodes, 'targets': nodes, 'floor_id': 999}).status_code == 404
+    assert client.post('/api/path/matrix', json={'sources': nodes, 'targets': nodes, 'building_id': 999}).status_code == 404
+
+    response = client.post('/api/path/matrix', json={'sources': nodes[:1], 'targets': nodes, 'floor_id': floor_id})
+    assert response.status_code == 200
+    assert response.get_json()['distances'] == [[0, 10.0, 20.0]]